@@ -0,0 +1,234 @@
+"""Almacén versionado de las capas GeoJSON con refresco en segundo plano.
+
+Cada capa guarda la huella (sha1) de su GeoJSON y, si viene de HTTP, su
+ETag: un refresco solo descarga y procesa las capas que cambiaron. En la
+tabla de hechos el cambio se aplica como diferencia por
+``id_manzana_unif``: las filas sin cambios se reutilizan y solo las
+manzanas nuevas o modificadas pasan por ``from_features``.
+
+Cada versión es una ``Instantanea`` inmutable con las cinco capas; publicar
+una nueva es un único cambio de referencia. Las sesiones la adoptan en un
+límite del flujo (fuera de los pasos 4–7), nunca a mitad de un análisis.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import requests
+
+from instrumentacion import medir
+
+logger = logging.getLogger("avm.datos")
+
+CLAVES_DIFERENCIA = {"manzanas": "id_manzana_unif"}
+
+
+class ErrorCapa(Exception):
+    """Fallo al leer o procesar una capa; la causa queda en ``__cause__``."""
+
+    def __init__(self, nombre):
+        super().__init__(nombre)
+        self.nombre = nombre
+
+
+class Instantanea:
+    """Una versión completa y coherente de las capas."""
+
+    def __init__(self, numero, capas, huellas, huellas_filas, cambios=None):
+        self.numero = numero
+        self.capas = capas
+        self.huellas = huellas
+        # Huella de cada fila de las capas con clave (para la próxima diferencia)
+        self.huellas_filas = huellas_filas
+        self.cambios = cambios or {}
+        self.creada = time.time()
+
+
+class AlmacenDatos:
+
+    def __init__(self, fuentes, datos_dir=None, max_reintentos=3, espera_reintento=2):
+        self.fuentes = fuentes
+        self.datos_dir = datos_dir
+        self.max_reintentos = max_reintentos
+        self.espera_reintento = espera_reintento
+        self.actual = None
+        self.ultimo_refresco = None
+        self._etags = {}
+        self._lock = threading.Lock()
+        # Serializa los refrescos sin bloquear a quien lee ``actual`` o llama a ``cargar()``
+        self._lock_refresco = threading.Lock()
+        self._fin = threading.Event()
+        self._hilo = None
+
+    # --- Lectura de una capa ---
+    def _leer(self, nombre, condicional=False, aviso=None):
+        """``(bytes, etag)`` del GeoJSON; bytes es None si el servidor responde
+        304 (sin cambios). La ETag se guarda solo cuando la versión se publica."""
+        url = self.fuentes[nombre]
+        if self.datos_dir:
+            # Copia local de los GeoJSON (modo sin conexión / datos de prueba)
+            with open(os.path.join(self.datos_dir, url.rsplit("/", 1)[-1]), "rb") as f:
+                return f.read(), None
+
+        cabeceras = {}
+        if condicional and nombre in self._etags:
+            cabeceras["If-None-Match"] = self._etags[nombre]
+        for intento in range(self.max_reintentos):
+            try:
+                respuesta = requests.get(url, headers=cabeceras, timeout=30)
+                if respuesta.status_code == 304:
+                    return None, None
+                respuesta.raise_for_status()
+                return respuesta.content, respuesta.headers.get("ETag")
+            except requests.exceptions.RequestException as e:
+                if aviso is not None:
+                    aviso(f"Intento {intento + 1}/{self.max_reintentos} fallido al cargar {nombre}: {e}")
+                if intento == self.max_reintentos - 1:
+                    raise
+                time.sleep(self.espera_reintento)
+
+    @staticmethod
+    def _procesar(nombre, contenido, previa=None, previas=None):
+        """GeoDataFrame de la capa, resumen de cambios y huellas por fila.
+
+        Si la capa tiene clave y hay versión previa (``previa`` y sus huellas
+        ``previas``) se aplica como diferencia.
+        """
+        geojson_data = json.loads(contenido)
+        features = geojson_data["features"]
+        clave = CLAVES_DIFERENCIA.get(nombre)
+        cambios = huellas = None
+
+        if clave is None:
+            df = gpd.GeoDataFrame.from_features(features, crs="EPSG:4326")
+        else:
+            ids = pd.Index([f["properties"].get(clave) for f in features])
+            # Huella por fila: el texto del feature (solo se compara dentro del proceso)
+            huellas = pd.Series([hash(json.dumps(f, separators=(",", ":"))) for f in features], index=ids)
+            df, cambios = AlmacenDatos._aplicar_diferencia(features, ids, huellas, previa, previas)
+            if not ids.is_unique:
+                huellas = None
+
+        df.attrs["version"] = hashlib.sha1(contenido).hexdigest()[:12]
+        return df, cambios, huellas
+
+    @staticmethod
+    def _aplicar_diferencia(features, ids, huellas, previa, previas):
+        if previa is None or previas is None or previas.empty or not ids.is_unique:
+            return gpd.GeoDataFrame.from_features(features, crs="EPSG:4326"), None
+
+        pos_previa = previas.index.get_indexer(ids)
+        iguales = (pos_previa >= 0) & (previas.to_numpy()[pos_previa] == huellas.to_numpy())
+        distintas = np.flatnonzero(~iguales)
+        reutilizadas = previa.iloc[pos_previa[iguales]].set_axis(np.flatnonzero(iguales))
+
+        if len(distintas):
+            nuevas = gpd.GeoDataFrame.from_features([features[i] for i in distintas], crs="EPSG:4326")
+            if set(nuevas.columns) != set(previa.columns):
+                # Cambió el esquema: no se pueden mezclar filas, se procesa completa
+                return gpd.GeoDataFrame.from_features(features, crs="EPSG:4326"), None
+            df = pd.concat([reutilizadas, nuevas[previa.columns].set_axis(distintas)]).sort_index()
+        else:
+            df = reutilizadas
+        df = gpd.GeoDataFrame(df.reset_index(drop=True), geometry="geometry", crs="EPSG:4326")
+
+        agregadas = ids[distintas].difference(previas.index)
+        cambios = {
+            "agregadas": len(agregadas),
+            "modificadas": len(distintas) - len(agregadas),
+            "eliminadas": len(previas.index.difference(ids)),
+        }
+        return df, cambios
+
+    # --- Carga inicial y refresco ---
+    def cargar(self, progreso=None, aviso=None):
+        """Carga todas las capas (una sola vez aunque la llamen varias sesiones)."""
+        with self._lock:
+            if self.actual is not None:
+                return self.actual
+            capas, huellas, huellas_filas, etags = {}, {}, {}, {}
+            total = len(self.fuentes)
+            for idx, nombre in enumerate(self.fuentes, start=1):
+                if progreso is not None:
+                    progreso(idx, total, nombre)
+                try:
+                    contenido, etags[nombre] = self._leer(nombre, aviso=aviso)
+                    with medir(f"procesar_{nombre}"):
+                        capas[nombre], _, huellas_filas[nombre] = self._procesar(nombre, contenido)
+                except Exception as e:
+                    raise ErrorCapa(nombre) from e
+                huellas[nombre] = capas[nombre].attrs["version"]
+            self.actual = Instantanea(1, capas, huellas, huellas_filas)
+            self._guardar_etags(etags)
+            self.ultimo_refresco = time.time()
+            return self.actual
+
+    def refrescar(self):
+        """Vuelve a leer las capas y publica una versión nueva si alguna cambió.
+
+        Devuelve la instantánea nueva o None si no hubo cambios. La lectura y
+        el procesamiento ocurren fuera de ``_lock``; solo la publicación lo
+        toma. Si una capa falla se lanza ``ErrorCapa`` y se conserva la
+        versión actual.
+        """
+        with self._lock_refresco:
+            actual = self.actual
+            if actual is None:
+                return None
+            with medir("refresco_datos"):
+                capas, huellas, cambios = dict(actual.capas), dict(actual.huellas), {}
+                huellas_filas, etags = dict(actual.huellas_filas), {}
+                for nombre in self.fuentes:
+                    try:
+                        contenido, etags[nombre] = self._leer(nombre, condicional=True)
+                        if contenido is None:
+                            continue
+                        huella = hashlib.sha1(contenido).hexdigest()[:12]
+                        if huella == actual.huellas[nombre]:
+                            continue
+                        with medir(f"procesar_{nombre}"):
+                            capas[nombre], cambios[nombre], huellas_filas[nombre] = self._procesar(
+                                nombre, contenido, actual.capas[nombre], actual.huellas_filas.get(nombre)
+                            )
+                    except Exception as e:
+                        raise ErrorCapa(nombre) from e
+                    huellas[nombre] = huella
+
+            with self._lock:
+                if self.actual is not actual:
+                    # Otra carga publicó mientras se leía: esta lectura ya no aplica
+                    return None
+                self.ultimo_refresco = time.time()
+                self._guardar_etags(etags)
+                if not cambios:
+                    return None
+                # Publicación atómica: las sesiones ven la versión anterior o la nueva completa
+                nueva = self.actual = Instantanea(actual.numero + 1, capas, huellas, huellas_filas, cambios)
+            logger.info(json.dumps({"evento": "version_datos", "numero": nueva.numero,
+                                    "capas": {n: c or "completa" for n, c in cambios.items()}}))
+            return nueva
+
+    def _guardar_etags(self, etags):
+        self._etags.update({nombre: etag for nombre, etag in etags.items() if etag})
+
+    def _bucle(self, intervalo):
+        while not self._fin.wait(intervalo):
+            try:
+                self.refrescar()
+            except Exception:
+                logger.exception("Fallo al refrescar los datos; se mantiene la versión actual")
+
+    def iniciar_refresco(self, intervalo):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, args=(intervalo,), daemon=True, name="avm-refresco")
+            self._hilo.start()
+
+    def detener(self):
+        self._fin.set()
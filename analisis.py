@@ -0,0 +1,264 @@
+"""Lógica de análisis de los pasos 2–7, sin dependencia de Streamlit.
+
+Estas funciones reciben los GeoDataFrames cargados y devuelven datos listos
+para pintar; así pueden ejecutarse desde la app, desde el generador de carga
+o desde otros procesos.
+"""
+
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+
+import geopandas as gpd
+import pandas as pd
+import plotly.express as px
+from shapely.geometry import MultiPoint, Point
+
+from instrumentacion import medir
+
+CRS_METRICO = 3116
+COLUMNAS_PROYECCION = ["valor_m2", "valor_2025_s1", "valor_2025_s2", "valor_2026_s1", "valor_2026_s2"]
+PERIODOS = ["2024-S2", "2025-S1", "2025-S2", "2026-S1", "2026-S2"]
+
+
+# --- Versión de los datos y cachés derivadas por versión ---
+def version_datos(df):
+    """Huella del contenido de una capa; se guarda en ``df.attrs["version"]``.
+
+    ``cargar_datasets()`` la fija a partir del GeoJSON original; si falta se
+    calcula con los atributos y las coordenadas extremas de cada geometría.
+    """
+    version = df.attrs.get("version")
+    if version is None:
+        columnas = [c for c in df.columns if c != "geometry"]
+        huella = hashlib.sha1(pd.util.hash_pandas_object(df[columnas], index=False).values.tobytes())
+        if isinstance(df, gpd.GeoDataFrame):
+            huella.update(df.geometry.bounds.values.tobytes())
+        version = huella.hexdigest()[:12]
+        df.attrs["version"] = version
+    return version
+
+
+_derivados = {}
+_en_construccion = {}
+_lock_derivados = threading.Lock()
+
+
+def por_version(nombre, df, construir, max_versiones=2, dependencias=()):
+    """Construye ``construir(df)`` una vez por versión de datos y lo comparte
+    entre sesiones; conserva solo las últimas ``max_versiones``.
+
+    Si el objeto también depende de otras capas (``dependencias``), sus
+    versiones entran en la clave y no en el nombre, para que las versiones
+    viejas se descarten igual. Las sesiones que piden una clave mientras otra
+    la construye esperan ese mismo resultado; si la construcción falla, el
+    error llega a todas y la siguiente petición vuelve a intentarlo.
+    """
+    clave = (nombre, ":".join(version_datos(c) for c in (df, *dependencias)))
+    with _lock_derivados:
+        if clave in _derivados:
+            return _derivados[clave]
+        futuro = _en_construccion.get(clave)
+        propio = futuro is None
+        if propio:
+            futuro = _en_construccion[clave] = Future()
+    if not propio:
+        return futuro.result()
+    try:
+        valor = construir(df)
+    except BaseException as error:
+        with _lock_derivados:
+            del _en_construccion[clave]
+        futuro.set_exception(error)
+        raise
+    with _lock_derivados:
+        _derivados[clave] = valor
+        del _en_construccion[clave]
+        versiones = [c for c in _derivados if c[0] == nombre]
+        for vieja in versiones[:-max_versiones]:
+            del _derivados[vieja]
+    futuro.set_result(valor)
+    return valor
+
+
+# --- Paso 2: Localidad bajo el clic ---
+def localidad_en_punto(localidades, lon, lat):
+    """Localidad que contiene el punto, con el índice espacial de la capa
+    (geopandas lo construye una vez y lo conserva)."""
+    with medir("localidad_clic"):
+        encontradas = localidades.sindex.query(Point(lon, lat), predicate="within")
+    if len(encontradas) == 0:
+        return None
+    return localidades["nombre_localidad"].iloc[encontradas.min()]
+
+
+# --- Paso 3: Manzanas de la localidad con su uso POT y color ---
+def codigo_localidad(localidades, localidad_sel):
+    return localidades[localidades["nombre_localidad"] == localidad_sel]["num_localidad"].values[0]
+
+
+def manzanas_de_localidad(areas, manzanas, cod_localidad):
+    areas_sel = areas[areas["num_localidad"] == cod_localidad].copy()
+    manzanas_sel = manzanas[manzanas["num_localidad"] == cod_localidad].copy()
+
+    if manzanas_sel.empty:
+        return manzanas_sel, {}
+
+    if not areas_sel.empty:
+        manzanas_sel = manzanas_sel.merge(
+            areas_sel[["id_area", "uso_pot_simplificado"]],
+            on="id_area",
+            how="left"
+        )
+    else:
+        manzanas_sel["uso_pot_simplificado"] = "Sin clasificación"
+
+    manzanas_sel["uso_pot_simplificado"] = manzanas_sel["uso_pot_simplificado"].fillna("Sin clasificación")
+
+    cats = manzanas_sel["uso_pot_simplificado"].unique().tolist()
+    palette = px.colors.qualitative.Plotly
+    color_map = {cat: palette[i % len(palette)] for i, cat in enumerate(cats)}
+    if "Sin clasificación" not in color_map:
+        color_map["Sin clasificación"] = "#2b2b2b"
+
+    manzanas_sel["color"] = manzanas_sel["uso_pot_simplificado"].apply(lambda x: color_map.get(x, "#2b2b2b"))
+    return manzanas_sel, color_map
+
+
+def geojson_manzanas(manzanas_sel):
+    manzanas_features = []
+    with medir("geojson_manzanas_iterrows"):
+        for _, row in manzanas_sel.iterrows():
+            manzanas_features.append({
+                "type": "Feature",
+                "geometry": json.loads(gpd.GeoSeries([row["geometry"]]).to_json())["features"][0]["geometry"],
+                "properties": {
+                    "id_manzana_unif": row["id_manzana_unif"],
+                    "color": row["color"]
+                }
+            })
+
+    return {
+        "type": "FeatureCollection",
+        "features": manzanas_features
+    }
+
+
+# --- Paso 4: Contexto de transporte y colegios ---
+def contexto_espacial(manzana_sel, transporte, colegios):
+    with medir("to_crs_manzana"):
+        manzana_proj = manzana_sel.to_crs(epsg=CRS_METRICO)
+        centroide = manzana_proj.geometry.centroid.to_crs(epsg=4326).iloc[0]
+
+    with medir("buffer_transporte_800m"):
+        buffer_transporte_proj = manzana_proj.buffer(800)
+        buffer_transporte_wgs = gpd.GeoSeries([buffer_transporte_proj.iloc[0]], crs=CRS_METRICO).to_crs(epsg=4326).iloc[0]
+
+    estaciones = []
+    id_combi = manzana_sel["id_combi_acceso"].iloc[0]
+    if pd.notna(id_combi):
+        multipunto_transporte = transporte.loc[transporte["id_combi_acceso"] == id_combi, "geometry"]
+        if not multipunto_transporte.empty:
+            estaciones = list(multipunto_transporte.iloc[0].geoms)
+
+    with medir("buffer_colegios_1000m"):
+        buffer_colegios_proj = manzana_proj.buffer(1000)
+        buffer_colegios_wgs = gpd.GeoSeries([buffer_colegios_proj.iloc[0]], crs=CRS_METRICO).to_crs(epsg=4326).iloc[0]
+
+    puntos_colegios = []
+    id_colegios = manzana_sel["id_com_colegios"].iloc[0]
+    if pd.notna(id_colegios):
+        colegios_filtered = colegios[colegios["id_com_colegios"] == id_colegios]
+        for geom in colegios_filtered.geometry:
+            if isinstance(geom, MultiPoint):
+                puntos_colegios.extend(list(geom.geoms))
+            elif isinstance(geom, Point):
+                puntos_colegios.append(geom)
+
+    return {
+        "centro": {"lat": centroide.y, "lon": centroide.x},
+        "manzana": manzana_sel.geometry.iloc[0],
+        "buffer_transporte": buffer_transporte_wgs,
+        "estaciones": estaciones,
+        "buffer_colegios": buffer_colegios_wgs,
+        "colegios": puntos_colegios,
+    }
+
+
+# --- Paso 5: Comparativo de valor m², usos POT y proyección ---
+def normalizar_uso_pot(manzanas_sel):
+    manzanas_sel = manzanas_sel.copy()
+    if "uso_pot_simplificado_y" in manzanas_sel.columns and "uso_pot_simplificado_x" in manzanas_sel.columns:
+        manzanas_sel["uso_pot_simplificado"] = manzanas_sel["uso_pot_simplificado_y"].combine_first(manzanas_sel["uso_pot_simplificado_x"]).fillna("Sin clasificación POT")
+    elif "uso_pot_simplificado" in manzanas_sel.columns:
+        manzanas_sel["uso_pot_simplificado"] = manzanas_sel["uso_pot_simplificado"].fillna("Sin clasificación POT")
+    else:
+        manzanas_sel["uso_pot_simplificado"] = "Sin clasificación POT"
+    return manzanas_sel
+
+
+def comparativo_valor(manzanas_sel, manzana_id):
+    manzanas_sel = normalizar_uso_pot(manzanas_sel)
+    manzana_sel = manzanas_sel[manzanas_sel["id_manzana_unif"] == manzana_id]
+
+    id_area_manzana = manzana_sel["id_area"].values[0]
+    if pd.notna(id_area_manzana):
+        manzanas_area = manzanas_sel[manzanas_sel["id_area"] == id_area_manzana]
+    else:
+        manzanas_area = manzanas_sel[manzanas_sel["id_area"].isna()]
+
+    promedio_area = manzanas_area["valor_m2"].mean() if not manzanas_area.empty else 0
+    valor_manzana = manzana_sel["valor_m2"].values[0]
+
+    with medir("buffer_intersects_300m"):
+        buffer_300 = manzana_sel.to_crs(epsg=CRS_METRICO).buffer(300).to_crs(epsg=4326)
+        manzanas_buffer = manzanas_sel[manzanas_sel.geometry.intersects(buffer_300.iloc[0])]
+    promedio_buffer = manzanas_buffer["valor_m2"].mean() if not manzanas_buffer.empty else 0
+
+    with medir("buffer_intersects_500m"):
+        buffer_uso = manzana_sel.to_crs(epsg=CRS_METRICO).buffer(500).to_crs(epsg=4326)
+        manzanas_buffer_uso = manzanas_sel[manzanas_sel.geometry.intersects(buffer_uso.iloc[0])]
+
+    conteo_uso = manzanas_buffer_uso["uso_pot_simplificado"].value_counts().reset_index()
+    conteo_uso.columns = ["uso", "cantidad"]
+    uso_pot_mayoritario = conteo_uso.iloc[0]["uso"] if not conteo_uso.empty else "Sin clasificación POT"
+
+    return {
+        "manzana_sel": manzana_sel,
+        "cod_localidad": manzana_sel["num_localidad"].values[0],
+        "id_area": id_area_manzana,
+        "valor_manzana": valor_manzana,
+        "promedio_area": promedio_area,
+        "promedio_buffer": promedio_buffer,
+        "conteo_uso": conteo_uso,
+        "uso_pot_mayoritario": uso_pot_mayoritario,
+    }
+
+
+def nombre_de_localidad(localidades, cod_localidad):
+    return localidades.loc[localidades["num_localidad"] == cod_localidad, "nombre_localidad"].values[0]
+
+
+def ficha_estilizada(comparativo, manzana_id, nombre_localidad):
+    manzana_sel = comparativo["manzana_sel"]
+    return pd.DataFrame({
+        "ID Manzana": [manzana_id],
+        "Localidad": [nombre_localidad],
+        "Estrato": [manzana_sel["estrato"].values[0]],
+        "Valor m²": [f"${comparativo['valor_manzana']:,.0f}"],
+        "Prom. Área POT": [f"${comparativo['promedio_area']:,.0f}"],
+        "Prom. 300m": [f"${comparativo['promedio_buffer']:,.0f}"],
+        "Rentabilidad": [manzana_sel["rentabilidad"].values[0]]
+    })
+
+
+# --- Paso 6: Contexto de seguridad ---
+def tabla_seguridad(localidades, cod_loc):
+    df_seguridad = localidades[["nombre_localidad", "num_localidad", "cantidad_delitos", "nivel_riesgo_delictivo"]].copy()
+    df_seguridad["es_localidad_actual"] = df_seguridad["num_localidad"] == cod_loc
+    df_seguridad["etiqueta"] = df_seguridad.apply(
+        lambda row: row["nivel_riesgo_delictivo"] if row["es_localidad_actual"] else "", axis=1
+    )
+    df_seguridad.sort_values("cantidad_delitos", ascending=True, inplace=True)
+    return df_seguridad
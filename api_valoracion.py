@@ -0,0 +1,324 @@
+"""Servicio HTTP/JSON local con las cifras de valoración de una o varias manzanas.
+
+Expone lo que la app calcula en los pasos 5–7 (valor m², promedios del área
+POT y de 300 m, uso POT mayoritario, seguridad de la localidad y proyección)
+para otras herramientas internas:
+
+    GET  /valoracion/<id_manzana_unif>
+    POST /valoracion            {"ids": ["01010000", "01010001", ...]}
+    GET  /salud
+
+Usa el mismo ``AlmacenDatos`` que la app, así que comparte capas, índices
+espaciales y matriz de proyección (construidos una vez por versión). Las
+respuestas se guardan en una LRU por (manzana, versión de datos); los fallos
+de las peticiones simultáneas se agrupan en un único ``comparar_manzanas`` y
+quien pide una manzana que ya se está calculando espera a ese mismo cálculo.
+
+Dentro de Streamlit arranca con ``AVM_API_PUERTO``; también se puede lanzar solo:
+
+    python api_valoracion.py --datos datos_prueba/ --puerto 8503
+"""
+
+import argparse
+import json
+import logging
+import math
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as TiempoAgotado
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+import numpy as np
+
+from almacen_datos import AlmacenDatos, ErrorCapa
+from analisis import por_version
+from comparacion import base_espacial, comparar_manzanas
+from datos_prueba import ARCHIVOS
+from instrumentacion import marcar_ejecucion, medir
+from proyeccion import matriz_proyeccion
+
+logger = logging.getLogger("avm.api")
+
+MAX_LOTE = 1000
+MAX_ENTRADAS = 20000
+# Segundos que una petición espera a sus cálculos antes de responder 503
+ESPERA_MAXIMA = 30
+
+
+def _json(valor):
+    """Tipos NumPy a Python y NaN a null."""
+    if isinstance(valor, dict):
+        return {k: _json(v) for k, v in valor.items()}
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    if isinstance(valor, float) and math.isnan(valor):
+        return None
+    return valor
+
+
+def _seguridad(localidades):
+    return por_version("api_seguridad", localidades, lambda df: df.set_index("num_localidad")[
+        ["cantidad_delitos", "nivel_riesgo_delictivo"]].to_dict("index"))
+
+
+def calcular_valoraciones(ids, capas):
+    """Valoración de las manzanas encontradas, como dict por id."""
+    tabla, _ = comparar_manzanas(ids, capas["manzanas"], capas["areas"], capas["transporte"],
+                                 capas["colegios"], capas["localidades"])
+    if tabla.empty:
+        return {}
+    matriz = matriz_proyeccion(capas["manzanas"])
+    seguridad = _seguridad(capas["localidades"])
+    valoraciones = {}
+    for fila in tabla.to_dict("records"):
+        manzana_id = fila["id_manzana_unif"]
+        valoraciones[manzana_id] = _json({
+            "id_manzana_unif": manzana_id,
+            "localidad": fila["localidad"],
+            "num_localidad": fila["num_localidad"],
+            "estrato": fila["estrato"],
+            "valor_m2": fila["valor_m2"],
+            "promedio_area": fila["promedio_area"],
+            "promedio_buffer": fila["promedio_300m"],
+            "vs_300m": fila["vs_300m"],
+            "uso_pot": fila["uso_pot"],
+            "uso_pot_mayoritario": fila["uso_pot_mayoritario_500m"],
+            "estaciones_800m": fila["estaciones_800m"],
+            "colegios_1000m": fila["colegios_1000m"],
+        })
+        valoraciones[manzana_id]["seguridad"] = _json(seguridad.get(fila["num_localidad"], {}))
+        proyeccion = matriz.metricas(manzana_id)
+        valoraciones[manzana_id]["proyeccion"] = None if proyeccion is None else {
+            k: _json(v) for k, v in proyeccion.items()}
+    return valoraciones
+
+
+class ServicioValoracion:
+    """Valoraciones con LRU por versión, coalescencia y cálculo por lotes.
+
+    Los fallos de caché de todas las peticiones van a una cola; un único hilo
+    la vacía y resuelve lo acumulado con un ``comparar_manzanas`` por versión.
+    Así el coste fijo de cada llamada (~17 ms) se reparte entre las
+    peticiones simultáneas en lugar de pagarse una vez por manzana.
+    """
+
+    def __init__(self, almacen, max_entradas=MAX_ENTRADAS):
+        self.almacen = almacen
+        self.max_entradas = max_entradas
+        self._cache = OrderedDict()
+        self._en_curso = {}
+        self._version = None
+        self._lock = threading.Lock()
+        self._cola = queue.SimpleQueue()
+        self.aciertos = self.fallos = self.coalescidas = 0
+        self._hilo = None
+        self._asegurar_hilo()
+
+    def _asegurar_hilo(self):
+        """Arranca el hilo de lotes, o uno nuevo si el anterior murió."""
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name="avm-api-lotes", daemon=True)
+                self._hilo.start()
+
+    def preparar(self):
+        """Carga los datos y construye las estructuras compartidas antes de servir."""
+        capas = self.almacen.cargar().capas
+        base_espacial(capas["manzanas"], capas["areas"], capas["transporte"], capas["colegios"])
+        matriz_proyeccion(capas["manzanas"])
+
+    def valorar(self, ids):
+        """``(versión, {id: valoración o None})`` para los ids pedidos.
+
+        Lanza ``TiempoAgotado`` si los cálculos no terminan en ``ESPERA_MAXIMA``.
+        """
+        # Sin el lock del almacén: un refresco en curso no frena las consultas
+        actual = self.almacen.actual
+        if actual is None:
+            actual = self.almacen.cargar()
+        numero = actual.numero
+        resultados, pendientes, nuevas = {}, {}, []
+        with self._lock:
+            if self._version != numero:
+                # Versión nueva: las respuestas anteriores ya no se piden
+                self._cache.clear()
+                self._version = numero
+            for manzana_id in dict.fromkeys(map(str, ids)):
+                clave = (manzana_id, numero)
+                if clave in self._cache:
+                    self._cache.move_to_end(clave)
+                    resultados[manzana_id] = self._cache[clave]
+                    self.aciertos += 1
+                elif clave in self._en_curso:
+                    pendientes[manzana_id] = self._en_curso[clave]
+                    self.coalescidas += 1
+                else:
+                    pendientes[manzana_id] = self._en_curso[clave] = Future()
+                    nuevas.append(clave)
+                    self.fallos += 1
+
+        if nuevas:
+            marcar_ejecucion("api_valoracion")
+            self._asegurar_hilo()
+            self._cola.put((actual, nuevas))
+        limite = time.monotonic() + ESPERA_MAXIMA
+        for manzana_id, futuro in pendientes.items():
+            resultados[manzana_id] = futuro.result(timeout=max(limite - time.monotonic(), 0))
+        return numero, resultados
+
+    def _bucle(self):
+        while True:
+            peticiones = [self._cola.get()]
+            while not self._cola.empty():
+                peticiones.append(self._cola.get())
+            claves = [clave for _, nuevas in peticiones for clave in nuevas]
+            error = RuntimeError("El lote de valoraciones terminó sin resultado")
+            try:
+                lotes = {}
+                for actual, nuevas in peticiones:
+                    lotes.setdefault(actual.numero, (actual, []))[1].extend(nuevas)
+                for actual, claves_lote in lotes.values():
+                    self._calcular_lote(actual, claves_lote)
+            except Exception as e:
+                logger.exception("Fallo al calcular un lote de valoraciones")
+                error = e
+            finally:
+                # Ninguna petición se queda esperando un cálculo que ya no llegará
+                self._liberar(claves, error)
+
+    def _calcular_lote(self, actual, claves):
+        with medir("api_valoracion_lote"):
+            calculadas = calcular_valoraciones([manzana_id for manzana_id, _ in claves], actual.capas)
+        with self._lock:
+            for clave in claves:
+                # También se guardan los ids inexistentes (None) para esta versión
+                valor = calculadas.get(clave[0])
+                if self._version == clave[1]:
+                    self._cache[clave] = valor
+                futuro = self._en_curso.pop(clave, None)
+                if futuro is not None:
+                    futuro.set_result(valor)
+            while len(self._cache) > self.max_entradas:
+                self._cache.popitem(last=False)
+
+    def _liberar(self, claves, error):
+        with self._lock:
+            for clave in claves:
+                futuro = self._en_curso.pop(clave, None)
+                if futuro is not None and not futuro.done():
+                    futuro.set_exception(error)
+
+    def salud(self):
+        actual = self.almacen.actual
+        with self._lock:
+            return {
+                "estado": "ok" if actual is not None else "sin_datos",
+                "version_datos": None if actual is None else actual.numero,
+                "cache": {"entradas": len(self._cache), "aciertos": self.aciertos,
+                          "fallos": self.fallos, "coalescidas": self.coalescidas},
+            }
+
+
+class _ManejadorValoracion(BaseHTTPRequestHandler):
+    # Conexiones persistentes: un cliente puede encadenar cientos de consultas.
+    # Sin Nagle, cabeceras y cuerpo no esperan el ACK retardado (~40 ms)
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _responder(self, estado, datos):
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _atender(self, funcion):
+        try:
+            with medir("api_valoracion", cache=True):
+                estado, datos = funcion()
+        except TiempoAgotado:
+            estado, datos = 503, {"error": "La valoración tardó demasiado; inténtalo de nuevo"}
+        except ErrorCapa as e:
+            logger.exception("No se pudieron cargar los datos")
+            estado, datos = 503, {"error": f"No se pudo cargar la capa {e.nombre}"}
+        except Exception:
+            logger.exception("Error al atender %s %s", self.command, self.path)
+            estado, datos = 500, {"error": "Error interno"}
+        self._responder(estado, datos)
+
+    def _valoracion(self, manzana_id):
+        numero, resultados = self.server.servicio.valorar([manzana_id])
+        if resultados[manzana_id] is None:
+            return 404, {"error": f"Manzana no encontrada: {manzana_id}", "version_datos": numero}
+        return 200, {"version_datos": numero, **resultados[manzana_id]}
+
+    def _lote(self, cuerpo):
+        try:
+            ids = json.loads(cuerpo)["ids"]
+        except (ValueError, KeyError, TypeError):
+            return 400, {"error": 'Se espera un JSON {"ids": [...]}'}
+        if not isinstance(ids, list):
+            return 400, {"error": '"ids" debe ser una lista'}
+        if len(ids) > MAX_LOTE:
+            return 400, {"error": f"Máximo {MAX_LOTE} manzanas por lote"}
+        numero, resultados = self.server.servicio.valorar(ids)
+        return 200, {
+            "version_datos": numero,
+            "resultados": [v for v in resultados.values() if v is not None],
+            "no_encontradas": [i for i, v in resultados.items() if v is None],
+        }
+
+    def do_GET(self):
+        ruta = urlsplit(self.path).path.rstrip("/")
+        if ruta == "/salud":
+            self._responder(200, self.server.servicio.salud())
+        elif ruta.startswith("/valoracion/"):
+            self._atender(lambda: self._valoracion(unquote(ruta[len("/valoracion/"):])))
+        else:
+            self._responder(404, {"error": "Ruta no encontrada"})
+
+    def do_POST(self):
+        cuerpo = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if urlsplit(self.path).path.rstrip("/") != "/valoracion":
+            self._responder(404, {"error": "Ruta no encontrada"})
+            return
+        self._atender(lambda: self._lote(cuerpo))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def iniciar_servidor_valoracion(servicio, puerto, host="127.0.0.1"):
+    """Atiende la API en un hilo de fondo y devuelve el servidor."""
+    servidor = ThreadingHTTPServer((host, int(puerto)), _ManejadorValoracion)
+    servidor.daemon_threads = True
+    servidor.servicio = servicio
+    hilo = threading.Thread(target=servidor.serve_forever, name="avm-api", daemon=True)
+    hilo.start()
+    return servidor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API local de valoración de manzanas.")
+    parser.add_argument("--datos", required=True, help="carpeta con los GeoJSON de la app")
+    parser.add_argument("--puerto", type=int, default=8503)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--refresco", type=float, help="segundos entre refrescos de los datos")
+    args = parser.parse_args()
+
+    almacen = AlmacenDatos(ARCHIVOS, args.datos)
+    servicio = ServicioValoracion(almacen)
+    servicio.preparar()
+    if args.refresco:
+        almacen.iniciar_refresco(args.refresco)
+    servidor = iniciar_servidor_valoracion(servicio, args.puerto, args.host)
+    print(f"API de valoración en http://{args.host}:{args.puerto} "
+          f"({len(almacen.actual.capas['manzanas'])} manzanas)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
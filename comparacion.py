@@ -0,0 +1,143 @@
+"""Comparación de varias manzanas con un único análisis espacial por lotes.
+
+En lugar de repetir los pasos 4 y 5 por cada candidata, los buffers de todas
+se calculan de una vez (vectorizados en EPSG:3116) y se resuelven con una
+sola consulta al índice espacial de la tabla de hechos. Las capas
+proyectadas y sus índices se construyen una vez por versión de datos.
+"""
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from analisis import CRS_METRICO, por_version
+from instrumentacion import medir
+from proyeccion import matriz_proyeccion
+
+RADIO_VALOR = 300
+RADIO_USOS = 500
+RADIO_TRANSPORTE = 800
+RADIO_COLEGIOS = 1000
+
+
+class BaseEspacial:
+    """Manzanas, estaciones y colegios proyectados, con índice espacial."""
+
+    def __init__(self, manzanas, areas, transporte, colegios):
+        with medir("base_espacial"):
+            usos = areas[["id_area", "uso_pot_simplificado"]].drop_duplicates("id_area")
+            base = manzanas.drop(columns=["uso_pot_simplificado"], errors="ignore").merge(usos, on="id_area", how="left")
+            base["uso_pot_simplificado"] = base["uso_pot_simplificado"].fillna("Sin clasificación POT")
+            self.manzanas = base.to_crs(epsg=CRS_METRICO)
+            self.manzanas.sindex
+
+            self.num_localidad = self.manzanas["num_localidad"].to_numpy()
+            self.id_area = self.manzanas["id_area"].to_numpy()
+            self.valor_m2 = pd.to_numeric(self.manzanas["valor_m2"], errors="coerce").to_numpy(dtype=np.float64)
+            self.uso_pot = self.manzanas["uso_pot_simplificado"].to_numpy()
+
+            ids = pd.Index(self.manzanas["id_manzana_unif"])
+            self.posiciones = pd.Series(np.arange(len(ids)), index=ids)[~ids.duplicated()]
+
+            # Promedio de valor m² por (localidad, área POT); las manzanas sin
+            # área se promedian juntas dentro de su localidad, como en el paso 5
+            claves = pd.DataFrame({"num_localidad": self.num_localidad,
+                                   "id_area": self.id_area, "valor_m2": self.valor_m2})
+            self.promedio_area = claves.groupby(["num_localidad", "id_area"], dropna=False)["valor_m2"].mean()
+
+            self.estaciones = self._puntos(transporte)
+            self.colegios = self._puntos(colegios)
+
+    @staticmethod
+    def _puntos(capa):
+        puntos = capa.geometry.explode(index_parts=False)
+        puntos = puntos[~puntos.is_empty].to_crs(epsg=CRS_METRICO)
+        # Una estación o colegio aparece en varias combinaciones: se deduplica por coordenada
+        coords = pd.DataFrame(shapely.get_coordinates(puntos.values)).round(2)
+        puntos = puntos[~coords.duplicated().to_numpy()].reset_index(drop=True)
+        puntos.sindex
+        return puntos
+
+
+def base_espacial(manzanas, areas, transporte, colegios):
+    # La clave incluye la versión de todas las capas, no solo la de manzanas
+    return por_version("base_espacial", manzanas, lambda m: BaseEspacial(m, areas, transporte, colegios),
+                       dependencias=(areas, transporte, colegios))
+
+
+def comparar_manzanas(ids, manzanas, areas, transporte, colegios, localidades=None):
+    """Pasos 4 y 5 para un conjunto de manzanas a la vez.
+
+    Devuelve ``(tabla, usos)``: una fila por manzana encontrada (en el orden
+    de ``ids``) y el conteo de usos POT en 500 m por manzana.
+    """
+    base = base_espacial(manzanas, areas, transporte, colegios)
+    ids = list(dict.fromkeys(ids))
+    encontradas = [i for i in ids if i in base.posiciones.index]
+    pos = base.posiciones.loc[encontradas].to_numpy()
+    if len(pos) == 0:
+        return pd.DataFrame(), pd.DataFrame()
+
+    with medir("comparacion_lote"):
+        geoms = base.manzanas.geometry.values[pos]
+        loc_cand = base.num_localidad[pos]
+
+        # Buffers vectorizados y una sola consulta al índice con el radio mayor
+        buffer_usos = shapely.buffer(geoms, RADIO_USOS)
+        buffer_valor = shapely.buffer(geoms, RADIO_VALOR)
+        i_cand, j_manzana = base.manzanas.sindex.query(buffer_usos, predicate="intersects")
+
+        # Igual que el paso 5: solo manzanas de la misma localidad
+        misma = base.num_localidad[j_manzana] == loc_cand[i_cand]
+        i_cand, j_manzana = i_cand[misma], j_manzana[misma]
+        en_300 = shapely.intersects(buffer_valor[i_cand], base.manzanas.geometry.values[j_manzana])
+
+        n = len(pos)
+        valores = base.valor_m2[j_manzana[en_300]]
+        validos = ~np.isnan(valores)
+        grupos = i_cand[en_300][validos]
+        suma = np.bincount(grupos, weights=valores[validos], minlength=n)
+        conteo = np.bincount(grupos, minlength=n)
+        with np.errstate(invalid="ignore"):
+            promedio_300 = np.where(conteo > 0, suma / np.maximum(conteo, 1), 0.0)
+
+        usos = pd.crosstab(pd.Index(np.asarray(encontradas, dtype=object)[i_cand], name="id_manzana_unif"),
+                           pd.Index(base.uso_pot[j_manzana], name="uso"))
+        usos = usos.reindex(encontradas, fill_value=0).rename_axis("id_manzana_unif")
+        mayoritario = usos.idxmax(axis=1).where(usos.sum(axis=1) > 0, "Sin clasificación POT")
+
+        i_est, _ = base.estaciones.sindex.query(shapely.buffer(geoms, RADIO_TRANSPORTE), predicate="intersects")
+        i_col, _ = base.colegios.sindex.query(shapely.buffer(geoms, RADIO_COLEGIOS), predicate="intersects")
+
+        claves_area = pd.MultiIndex.from_arrays([loc_cand, base.id_area[pos]])
+        promedio_area = base.promedio_area.reindex(claves_area).fillna(0).to_numpy()
+
+        matriz = matriz_proyeccion(manzanas)
+        pos_matriz = np.array([matriz.posicion(i) for i in encontradas])
+
+        filas = base.manzanas.iloc[pos]
+        tabla = pd.DataFrame({
+            "id_manzana_unif": encontradas,
+            "num_localidad": loc_cand,
+            "estrato": filas["estrato"].to_numpy(),
+            "uso_pot": base.uso_pot[pos],
+            "valor_m2": base.valor_m2[pos],
+            "promedio_area": promedio_area,
+            "promedio_300m": promedio_300,
+            "uso_pot_mayoritario_500m": mayoritario.to_numpy(),
+            "estaciones_800m": np.bincount(i_est, minlength=n),
+            "colegios_1000m": np.bincount(i_col, minlength=n),
+            "estaciones_cerca": filas["estaciones_cerca"].to_numpy(),
+            "colegio_cerca": filas["colegio_cerca"].to_numpy(),
+            "valor_2026_s2": matriz.valores[pos_matriz, -1],
+            "crecimiento_total": matriz.crecimiento_total[pos_matriz],
+            "cagr": matriz.cagr[pos_matriz],
+            "percentil_localidad": matriz.percentil_localidad[pos_matriz],
+        })
+        with np.errstate(divide="ignore", invalid="ignore"):
+            tabla["vs_300m"] = np.where(promedio_300 > 0, tabla["valor_m2"] / promedio_300 - 1, np.nan)
+        if localidades is not None:
+            nombres = localidades.set_index("num_localidad")["nombre_localidad"]
+            tabla.insert(1, "localidad", tabla["num_localidad"].map(nombres))
+
+    return tabla, usos
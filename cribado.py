@@ -0,0 +1,89 @@
+"""Cribado y ranking de manzanas sobre toda la tabla de hechos.
+
+Las columnas que se filtran se guardan como arreglos NumPy (una tabla por
+versión de datos, compartida entre sesiones); cada consulta es una máscara
+booleana más una selección parcial del top-N, sin recorrer filas en Python.
+"""
+
+import numpy as np
+import pandas as pd
+
+from analisis import por_version
+from proyeccion import matriz_proyeccion
+
+CRITERIOS = {
+    "crecimiento_2026_s2": "Crecimiento proyectado a 2026-S2",
+    "cagr": "Crecimiento anual compuesto (CAGR)",
+    "percentil_localidad": "Percentil de crecimiento en su localidad",
+    "valor_2026_s2": "Valor m² proyectado 2026-S2",
+    "valor_m2": "Valor m² actual",
+    "rentabilidad": "Rentabilidad",
+}
+
+
+def _numerica(manzanas, columna, dtype=np.float64):
+    if columna not in manzanas.columns:
+        return np.full(len(manzanas), np.nan, dtype=dtype)
+    return pd.to_numeric(manzanas[columna], errors="coerce").to_numpy(dtype=dtype, na_value=np.nan)
+
+
+class TablaCribado:
+    """Columnas de la tabla de hechos en arreglos contiguos; las de
+    proyección vienen de la ``MatrizProyeccion`` de la misma versión."""
+
+    def __init__(self, manzanas):
+        matriz = matriz_proyeccion(manzanas)
+        self.ids = manzanas["id_manzana_unif"].to_numpy()
+        self.num_localidad = manzanas["num_localidad"].to_numpy()
+        self.valor_m2 = matriz.valores[:, 0]
+        self.valor_2026_s2 = matriz.valores[:, -1]
+        self.crecimiento_2026_s2 = matriz.crecimiento_total
+        self.cagr = matriz.cagr
+        self.percentil_localidad = matriz.percentil_localidad
+        self.rentabilidad = _numerica(manzanas, "rentabilidad")
+        self.estrato = _numerica(manzanas, "estrato")
+        self.estaciones_cerca = _numerica(manzanas, "estaciones_cerca")
+        self.colegio_cerca = _numerica(manzanas, "colegio_cerca")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def cribar(self, criterio="crecimiento_2026_s2", n=100, num_localidad=None, min_estrato=None,
+               max_estrato=None, min_estaciones=None, min_colegios=None, max_valor_m2=None,
+               descendente=True):
+        """Posiciones (iloc) de las ``n`` mejores manzanas según ``criterio``."""
+        valores = getattr(self, criterio)
+        mascara = ~np.isnan(valores)
+        if num_localidad is not None:
+            mascara &= self.num_localidad == num_localidad
+        if min_estrato is not None:
+            mascara &= self.estrato >= min_estrato
+        if max_estrato is not None:
+            mascara &= self.estrato <= max_estrato
+        if min_estaciones is not None:
+            mascara &= self.estaciones_cerca >= min_estaciones
+        if min_colegios is not None:
+            mascara &= self.colegio_cerca >= min_colegios
+        if max_valor_m2 is not None:
+            mascara &= self.valor_m2 <= max_valor_m2
+
+        candidatas = np.flatnonzero(mascara)
+        claves = -valores[candidatas] if descendente else valores[candidatas]
+        if len(candidatas) > n:
+            top = np.argpartition(claves, n - 1)[:n]
+            candidatas, claves = candidatas[top], claves[top]
+        return candidatas[np.argsort(claves, kind="stable")]
+
+
+def tabla_cribado(manzanas):
+    return por_version("cribado", manzanas, TablaCribado)
+
+
+def resultado_cribado(manzanas, posiciones):
+    """GeoDataFrame con las manzanas seleccionadas, en el orden del ranking."""
+    tabla = tabla_cribado(manzanas)
+    resultado = manzanas.iloc[posiciones].copy()
+    resultado.insert(0, "ranking", np.arange(1, len(posiciones) + 1))
+    resultado["crecimiento_2026_s2"] = tabla.crecimiento_2026_s2[posiciones]
+    resultado["cagr"] = tabla.cagr[posiciones]
+    return resultado
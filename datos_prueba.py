@@ -0,0 +1,161 @@
+"""Datos sintéticos con el mismo esquema que los GeoJSON de tfm-avm-bogota.
+
+Sirven para ejecutar la app y el generador de carga sin conexión:
+
+    python datos_prueba.py datos_prueba/
+    AVM_DATOS_DIR=datos_prueba streamlit run tfmapp.py
+"""
+
+import argparse
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from shapely.geometry import MultiPoint
+
+# Mismos nombres de archivo que en cargar_datasets()
+ARCHIVOS = {
+    "localidades": "dim_localidad.geojson",
+    "areas": "dim_area.geojson",
+    "manzanas": "tabla_hechos.geojson",
+    "transporte": "dim_transporte.geojson",
+    "colegios": "dim_colegios.geojson",
+}
+
+USOS_POT = ["Residencial", "Comercial", "Dotacional", "Industrial", "Mixto"]
+NIVELES_RIESGO = ["Bajo", "Medio", "Alto"]
+
+# Extensión aproximada del área urbana de Bogotá
+LON0, LAT0 = -74.20, 4.55
+LADO_LOCALIDAD = 0.03      # grados (~3.3 km)
+LADO_MANZANA = 0.0007      # grados (~78 m)
+
+
+def generar_datasets(filas=4, columnas=5, manzanas_por_lado=20, areas_por_localidad=3,
+                     combinaciones_por_localidad=12, semilla=0):
+    """Devuelve un dict de GeoDataFrames como el de ``cargar_datasets()``."""
+    rng = np.random.default_rng(semilla)
+    n_loc = filas * columnas
+
+    # --- Localidades: rejilla de rectángulos ---
+    fila, col = np.divmod(np.arange(n_loc), columnas)
+    x0 = LON0 + col * LADO_LOCALIDAD
+    y0 = LAT0 + fila * LADO_LOCALIDAD
+    num_localidad = np.arange(1, n_loc + 1)
+    localidades = gpd.GeoDataFrame({
+        "num_localidad": num_localidad,
+        "nombre_localidad": [f"Localidad {n:02d}" for n in num_localidad],
+        "cantidad_delitos": rng.integers(500, 20000, n_loc),
+        "nivel_riesgo_delictivo": rng.choice(NIVELES_RIESGO, n_loc),
+    }, geometry=shapely.box(x0, y0, x0 + LADO_LOCALIDAD, y0 + LADO_LOCALIDAD), crs="EPSG:4326")
+
+    # --- Áreas POT: franjas verticales dentro de cada localidad ---
+    ancho_area = LADO_LOCALIDAD / areas_por_localidad
+    loc_area = np.repeat(np.arange(n_loc), areas_por_localidad)
+    k_area = np.tile(np.arange(areas_por_localidad), n_loc)
+    ax0 = x0[loc_area] + k_area * ancho_area
+    id_area = np.arange(1, len(loc_area) + 1)
+    areas = gpd.GeoDataFrame({
+        "id_area": id_area,
+        "num_localidad": num_localidad[loc_area],
+        "area_pot": [f"Área de actividad {i}" for i in id_area],
+        "uso_pot_simplificado": rng.choice(USOS_POT, len(loc_area)),
+    }, geometry=shapely.box(ax0, y0[loc_area], ax0 + ancho_area, y0[loc_area] + LADO_LOCALIDAD), crs="EPSG:4326")
+
+    # --- Transporte y colegios: combinaciones de puntos por localidad ---
+    def combinaciones(max_puntos, prefijo):
+        ids, geoms, n_puntos = [], [], []
+        for i in range(n_loc):
+            for k in range(combinaciones_por_localidad):
+                n = int(rng.integers(1, max_puntos + 1))
+                px = x0[i] + rng.random(n) * LADO_LOCALIDAD
+                py = y0[i] + rng.random(n) * LADO_LOCALIDAD
+                ids.append(f"{prefijo}{i + 1:02d}{k:03d}")
+                geoms.append(MultiPoint(np.column_stack([px, py])))
+                n_puntos.append(n)
+        return np.array(ids), geoms, np.array(n_puntos)
+
+    ids_combi, geoms_combi, n_estaciones = combinaciones(4, "T")
+    transporte = gpd.GeoDataFrame({"id_combi_acceso": ids_combi}, geometry=geoms_combi, crs="EPSG:4326")
+    ids_col, geoms_col, n_colegios = combinaciones(6, "C")
+    colegios = gpd.GeoDataFrame({"id_com_colegios": ids_col}, geometry=geoms_col, crs="EPSG:4326")
+
+    # --- Manzanas: rejilla regular dentro de cada localidad ---
+    paso = LADO_LOCALIDAD / manzanas_por_lado
+    por_loc = manzanas_por_lado ** 2
+    loc_m = np.repeat(np.arange(n_loc), por_loc)
+    mi, mj = np.divmod(np.tile(np.arange(por_loc), n_loc), manzanas_por_lado)
+    mx0 = x0[loc_m] + mj * paso + (paso - LADO_MANZANA) / 2
+    my0 = y0[loc_m] + mi * paso + (paso - LADO_MANZANA) / 2
+    n_m = len(loc_m)
+
+    k_area_m = np.minimum((mj * paso // ancho_area).astype(int), areas_por_localidad - 1)
+    id_area_m = id_area[loc_m * areas_por_localidad + k_area_m].astype(float)
+    id_area_m[rng.random(n_m) < 0.02] = np.nan
+
+    combo_m = loc_m * combinaciones_por_localidad + rng.integers(0, combinaciones_por_localidad, n_m)
+    colegio_m = loc_m * combinaciones_por_localidad + rng.integers(0, combinaciones_por_localidad, n_m)
+
+    # Precio base por localidad con gradiente espacial y ruido por manzana
+    base_loc = rng.uniform(2.5e6, 9e6, n_loc)
+    valor_m2 = np.round(base_loc[loc_m] * (1 + 0.15 * mj / manzanas_por_lado) * rng.lognormal(0, 0.12, n_m), -3)
+    crecimiento = rng.normal(0.025, 0.02, (n_m, 4))
+    serie = valor_m2[:, None] * np.cumprod(1 + crecimiento, axis=1)
+
+    manzanas = gpd.GeoDataFrame({
+        "id_manzana_unif": [f"{num_localidad[l]:02d}{i:03d}{j:03d}" for l, i, j in zip(loc_m, mi, mj)],
+        "num_localidad": num_localidad[loc_m],
+        "id_area": id_area_m,
+        "id_combi_acceso": ids_combi[combo_m],
+        "id_com_colegios": ids_col[colegio_m],
+        "estrato": np.clip(np.round(base_loc[loc_m] / 1.6e6 + rng.normal(0, 0.7, n_m)), 1, 6).astype(int),
+        "valor_m2": valor_m2,
+        "valor_2025_s1": np.round(serie[:, 0], -3),
+        "valor_2025_s2": np.round(serie[:, 1], -3),
+        "valor_2026_s1": np.round(serie[:, 2], -3),
+        "valor_2026_s2": np.round(serie[:, 3], -3),
+        "rentabilidad": np.round((serie[:, 3] / valor_m2 - 1) * 100, 2),
+        "colegio_cerca": n_colegios[colegio_m],
+        "estaciones_cerca": n_estaciones[combo_m],
+    }, geometry=shapely.box(mx0, my0, mx0 + LADO_MANZANA, my0 + LADO_MANZANA), crs="EPSG:4326")
+
+    return {
+        "localidades": localidades,
+        "areas": areas,
+        "manzanas": manzanas,
+        "transporte": transporte,
+        "colegios": colegios,
+    }
+
+
+def escribir_geojson(dataframes, directorio):
+    os.makedirs(directorio, exist_ok=True)
+    for nombre, archivo in ARCHIVOS.items():
+        with open(os.path.join(directorio, archivo), "w", encoding="utf-8") as f:
+            f.write(dataframes[nombre].to_json())
+
+
+def leer_geojson(directorio):
+    """Lee los GeoJSON igual que ``cargar_datasets()`` (from_features en EPSG:4326)."""
+    dataframes = {}
+    for nombre, archivo in ARCHIVOS.items():
+        with open(os.path.join(directorio, archivo), encoding="utf-8") as f:
+            geojson_data = json.load(f)
+        dataframes[nombre] = gpd.GeoDataFrame.from_features(geojson_data["features"], crs="EPSG:4326")
+    return dataframes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera GeoJSON sintéticos para pruebas sin conexión.")
+    parser.add_argument("directorio")
+    parser.add_argument("--filas", type=int, default=4)
+    parser.add_argument("--columnas", type=int, default=5)
+    parser.add_argument("--manzanas-por-lado", type=int, default=20)
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    dfs = generar_datasets(args.filas, args.columnas, args.manzanas_por_lado, semilla=args.semilla)
+    escribir_geojson(dfs, args.directorio)
+    print(f"{len(dfs['manzanas'])} manzanas escritas en {args.directorio}")
@@ -0,0 +1,246 @@
+"""Figuras Plotly de cada paso y su exportación a PNG para el informe."""
+
+import os
+from io import BytesIO
+
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from analisis import PERIODOS
+from instrumentacion import medir
+
+
+# Backend de exportación PNG por despliegue: kaleido (Chromium) o matplotlib (en
+# proceso); "ninguno" devuelve PNG vacíos (prueba de carga sin render)
+BACKEND_RENDER = os.environ.get("AVM_RENDER_BACKEND", "kaleido")
+
+
+def a_png(fig, nombre):
+    """Renderiza la figura con el backend configurado y la devuelve en un BytesIO."""
+    with medir(f"write_image_{nombre}"):
+        if BACKEND_RENDER == "ninguno":
+            return BytesIO()
+        if BACKEND_RENDER == "matplotlib":
+            # matplotlib solo se importa si el despliegue usa este backend
+            import rasterizador
+            return rasterizador.a_png(fig)
+        buffer = BytesIO()
+        pio.write_image(fig, buffer, format='png', engine='kaleido')
+    return buffer
+
+
+# --- Paso 3 ---
+def figura_localidad(localidades, localidad_sel):
+    localidades = localidades.assign(seleccionada=localidades["nombre_localidad"] == localidad_sel)
+    bounds = localidades[localidades["seleccionada"]].total_bounds
+    center = {"lon": (bounds[0] + bounds[2]) / 2, "lat": (bounds[1] + bounds[3]) / 2}
+
+    fig_localidad = px.choropleth_mapbox(
+        localidades,
+        geojson=localidades.geometry,
+        locations=localidades.index,
+        color="seleccionada",
+        color_discrete_map={True: "red", False: "lightgray"},
+        hover_name="nombre_localidad",
+        mapbox_style="carto-positron",
+        center=center,
+        zoom=10
+    )
+    fig_localidad.update_layout(margin={"r":0,"t":0,"l":0,"b":0})
+    return fig_localidad, center
+
+
+# --- Paso 4 ---
+def figura_transporte(contexto):
+    buffer_wgs = contexto["buffer_transporte"]
+    manzana = contexto["manzana"]
+
+    fig_transporte = go.Figure(go.Scattermapbox(
+        lat=list(buffer_wgs.exterior.xy[1]),
+        lon=list(buffer_wgs.exterior.xy[0]),
+        mode='lines', fill='toself', name='Buffer 800m',
+        fillcolor='rgba(255,0,0,0.1)', line=dict(color='red')
+    ))
+
+    fig_transporte.add_trace(go.Scattermapbox(
+        lat=list(manzana.exterior.xy[1]),
+        lon=list(manzana.exterior.xy[0]),
+        mode='lines', fill='toself', name='Manzana',
+        fillcolor='rgba(0,128,0,0.3)', line=dict(color='darkgreen')
+    ))
+
+    puntos = contexto["estaciones"]
+    if puntos:
+        fig_transporte.add_trace(go.Scattermapbox(
+            lat=[p.y for p in puntos], lon=[p.x for p in puntos],
+            mode='markers', name='Estaciones', marker=dict(color='red', size=10)
+        ))
+
+    fig_transporte.update_layout(
+        mapbox_style="carto-positron", mapbox_center=contexto["centro"], mapbox_zoom=14,
+        margin={"r": 0, "t": 40, "l": 0, "b": 0}, title="Contexto de Transporte"
+    )
+    return fig_transporte
+
+
+def figura_colegios(contexto):
+    buffer_wgs = contexto["buffer_colegios"]
+
+    fig_colegios = go.Figure(go.Scattermapbox(
+        lat=list(buffer_wgs.exterior.xy[1]),
+        lon=list(buffer_wgs.exterior.xy[0]),
+        mode='lines', fill='toself', name='Buffer 1000m',
+        fillcolor='rgba(0,0,255,0.1)', line=dict(color='blue')
+    ))
+
+    puntos_colegios = contexto["colegios"]
+    if puntos_colegios:
+        lat_col,lon_col = zip(*[(point.y,point.x) for point in puntos_colegios])
+        fig_colegios.add_trace(go.Scattermapbox(
+            lat=lat_col,lon=lon_col,
+            mode='markers', name='Colegios', marker=dict(color='blue', size=10)
+        ))
+    fig_colegios.update_layout(
+        mapbox_style="carto-positron", mapbox_center=contexto["centro"], mapbox_zoom=14,
+        margin={"r": 0, "t": 40, "l": 0, "b": 0}, title="Contexto Educativo"
+    )
+    return fig_colegios
+
+
+# --- Paso 5 ---
+def figura_comparativo(comparativo):
+    valor_manzana = comparativo["valor_manzana"]
+    promedio_area = comparativo["promedio_area"]
+    promedio_buffer = comparativo["promedio_buffer"]
+
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=["Manzana seleccionada"], y=[valor_manzana], text=[f"${valor_manzana:,.0f}"], textposition="outside", marker_color='rgba(0, 102, 204, 0.8)'))
+    fig.add_trace(go.Bar(x=["Promedio área POT"] if pd.notna(comparativo["id_area"]) else ["Promedio sin área"], y=[promedio_area], text=[f"${promedio_area:,.0f}"], textposition="outside", marker_color='rgba(0, 102, 204, 0.6)'))
+    fig.add_trace(go.Bar(x=["Promedio 300m"], y=[promedio_buffer], text=[f"${promedio_buffer:,.0f}"], textposition="outside", marker_color='rgba(0, 102, 204, 0.4)'))
+
+    fig.update_layout(title="Comparativo de valor m² respecto al área POT y 300m a la redonda", yaxis_title="Valor por metro cuadrado", barmode="group", template="simple_white", margin=dict(l=0, r=0, t=40, b=0))
+    return fig
+
+
+def figura_distribucion_pot(conteo_uso, color_map, manzana_id):
+    colores = [color_map.get(uso, "gray") for uso in conteo_uso["uso"]]
+    fig_pie = px.pie(conteo_uso, values="cantidad", names="uso", color_discrete_sequence=colores, title=f"Distribución de usos POT en buffer de 500m\nManzana {manzana_id}")
+    fig_pie.update_traces(textinfo='percent+label', textfont_size=14)
+    fig_pie.update_layout(template="simple_white", margin=dict(l=0, r=0, t=40, b=0))
+    return fig_pie
+
+
+def figura_proyeccion(serie_proyeccion, manzana_id):
+    fig_line = go.Figure()
+    fig_line.add_trace(go.Scatter(x=PERIODOS, y=serie_proyeccion, mode="lines+markers+text", line=dict(color="royalblue", width=3), marker=dict(size=8), text=[f"${v:,.0f}" for v in serie_proyeccion], textposition="top center", textfont=dict(size=14), name="Proyección valor m²"))
+    fig_line.update_layout(title=f"Evolución Proyectada del Valor m² - Manzana {manzana_id}", xaxis_title="Periodo", yaxis_title="Valor m²", template="simple_white", margin=dict(l=0, r=0, t=40, b=0))
+    return fig_line
+
+
+# --- Paso 6 ---
+def figura_seguridad(df_seguridad):
+    fig = px.bar(
+        df_seguridad,
+        x="cantidad_delitos",
+        y="nombre_localidad",
+        orientation="h",
+        color="es_localidad_actual",
+        color_discrete_map={True: "darkgreen", False: "rgba(0,100,0,0.3)"},
+        text="etiqueta"
+    )
+
+    fig.update_traces(textposition="outside")
+    fig.update_layout(
+        title="Contexto de seguridad por localidad\nFuente: Secretaría Distrital de Seguridad y Convivencia",
+        xaxis_title="Cantidad de delitos",
+        yaxis_title=" ",
+        showlegend=False,
+        template="simple_white",
+        margin=dict(l=0, r=0, t=40, b=0)
+    )
+    fig.update_yaxes(categoryorder="total ascending")
+    return fig
+
+
+# --- Paso 7 ---
+def figura_manzanas(manzanas_localidad, color_map):
+    if "uso_pot_simplificado" not in manzanas_localidad.columns:
+        manzanas_localidad = manzanas_localidad.assign(uso_pot_simplificado="Sin clasificación POT")
+
+    bounds_m = manzanas_localidad.total_bounds
+    center_m = {
+        "lon": (bounds_m[0] + bounds_m[2]) / 2,
+        "lat": (bounds_m[1] + bounds_m[3]) / 2
+    }
+
+    fig_manzanas = px.choropleth_mapbox(
+        manzanas_localidad,
+        geojson=manzanas_localidad.geometry,
+        locations=manzanas_localidad.index,
+        color="uso_pot_simplificado",
+        color_discrete_map=color_map,
+        mapbox_style="carto-positron",
+        center=center_m,
+        zoom=12,
+        opacity=0.5,
+        hover_name="id_manzana_unif"
+    )
+
+    fig_manzanas.update_layout(
+        margin=dict(l=0, r=0, t=40, b=0),
+        title="Manzanas seleccionadas para el informe"
+    )
+    return fig_manzanas
+
+
+# --- Paso 8: Cribado ---
+def figura_cribado(resultado, criterio, etiqueta):
+    bounds = resultado.total_bounds
+    center = {"lon": (bounds[0] + bounds[2]) / 2, "lat": (bounds[1] + bounds[3]) / 2}
+    extension = max(bounds[2] - bounds[0], bounds[3] - bounds[1])
+
+    fig = px.choropleth_mapbox(
+        resultado,
+        geojson=resultado.geometry,
+        locations=resultado.index,
+        color=criterio,
+        color_continuous_scale="Viridis",
+        mapbox_style="carto-positron",
+        center=center,
+        zoom=10 if extension > 0.1 else 12,
+        opacity=0.7,
+        hover_name="id_manzana_unif",
+        hover_data={"ranking": True},
+        labels={criterio: etiqueta}
+    )
+    fig.update_layout(margin=dict(l=0, r=0, t=40, b=0), title=f"Top {len(resultado)} manzanas por {etiqueta.lower()}")
+    return fig
+
+
+# --- Paso 9: Comparación ---
+def figura_comparacion_valor(tabla):
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=tabla["id_manzana_unif"], y=tabla["valor_m2"], name="Manzana", marker_color='rgba(0, 102, 204, 0.8)'))
+    fig.add_trace(go.Bar(x=tabla["id_manzana_unif"], y=tabla["promedio_area"], name="Promedio área POT", marker_color='rgba(0, 102, 204, 0.6)'))
+    fig.add_trace(go.Bar(x=tabla["id_manzana_unif"], y=tabla["promedio_300m"], name="Promedio 300m", marker_color='rgba(0, 102, 204, 0.4)'))
+    fig.update_layout(title="Valor m² de cada manzana frente a su área POT y 300m a la redonda", yaxis_title="Valor por metro cuadrado", xaxis_type="category", barmode="group", template="simple_white", margin=dict(l=0, r=0, t=40, b=0))
+    return fig
+
+
+def figura_comparacion_usos(usos):
+    conteo = usos.reset_index().melt(id_vars="id_manzana_unif", var_name="uso", value_name="cantidad")
+    fig = px.bar(conteo, x="id_manzana_unif", y="cantidad", color="uso", title="Usos POT en un buffer de 500m")
+    fig.update_layout(xaxis_type="category", xaxis_title=" ", yaxis_title="Manzanas", barmode="stack", template="simple_white", margin=dict(l=0, r=0, t=40, b=0))
+    return fig
+
+
+def figura_comparacion_proyeccion(tabla):
+    fig = px.scatter(
+        tabla, x="valor_m2", y="cagr", size="estaciones_800m", size_max=25, color="localidad" if "localidad" in tabla.columns else None,
+        text="id_manzana_unif", title="Valor m² actual frente al crecimiento anual proyectado (tamaño: estaciones a 800m)"
+    )
+    fig.update_traces(textposition="top center")
+    fig.update_layout(xaxis_title="Valor m²", yaxis_title="CAGR", yaxis_tickformat=".1%", template="simple_white", margin=dict(l=0, r=0, t=40, b=0))
+    return fig
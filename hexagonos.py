@@ -0,0 +1,171 @@
+"""Agregación de manzanas en una rejilla hexagonal a varias resoluciones.
+
+Los centroides de las manzanas (en EPSG:3116, metros) se asignan a hexágonos
+con coordenadas axiales (redondeo cúbico vectorizado, sin dependencias
+externas tipo H3). Por cada celda se precalculan conteo, media y mediana de
+valor m², crecimiento proyectado y rentabilidad, guardados en arreglos
+NumPy. Hay una agregación por versión de datos, compartida entre sesiones:
+alimenta el mapa de calor y las estadísticas de vecindario del paso 5 sin
+volver a tocar los polígonos.
+"""
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from analisis import CRS_METRICO, por_version
+from instrumentacion import medir
+from proyeccion import matriz_proyeccion
+
+# Radio del hexágono (centro a vértice) en metros
+RESOLUCIONES = {
+    "250 m": 250,
+    "500 m": 500,
+    "1 km": 1000,
+    "2 km": 2000,
+}
+
+VARIABLES = {
+    "valor_m2": "Valor m²",
+    "crecimiento": "Crecimiento 2024-S2 → 2026-S2",
+    "rentabilidad": "Rentabilidad",
+}
+
+_RAIZ3 = np.sqrt(3)
+
+
+def a_hexagono(x, y, radio):
+    """Coordenadas axiales (q, r) del hexágono (vértice arriba) de cada punto."""
+    q = (_RAIZ3 / 3 * x - y / 3) / radio
+    r = (2 / 3 * y) / radio
+    s = -q - r
+    qr, rr, sr = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(qr - q), np.abs(rr - r), np.abs(sr - s)
+    # La coordenada con mayor error de redondeo se recalcula desde las otras dos
+    corrige_q = (dq > dr) & (dq > ds)
+    corrige_r = ~corrige_q & (dr > ds)
+    qr = np.where(corrige_q, -rr - sr, qr)
+    rr = np.where(corrige_r, -qr - sr, rr)
+    return qr.astype(np.int64), rr.astype(np.int64)
+
+
+def centro_hexagono(q, r, radio):
+    return radio * _RAIZ3 * (q + r / 2), radio * 1.5 * r
+
+
+def _medianas(grupos, valores, n_grupos, orden_valores):
+    """Mediana por grupo ignorando NaN. ``orden_valores`` (argsort de
+    ``valores``, NaN al final) se comparte entre resoluciones: aquí solo se
+    reordena de forma estable por grupo."""
+    orden = orden_valores[np.argsort(grupos[orden_valores], kind="stable")]
+    grupos, valores = grupos[orden], valores[orden]
+    validos = ~np.isnan(valores)
+    grupos, valores = grupos[validos], valores[validos]
+    conteo = np.bincount(grupos, minlength=n_grupos)
+    inicio = np.cumsum(conteo) - conteo
+    mediana = np.full(n_grupos, np.nan)
+    hay = conteo > 0
+    bajo = valores[inicio[hay] + (conteo[hay] - 1) // 2]
+    alto = valores[inicio[hay] + conteo[hay] // 2]
+    mediana[hay] = (bajo + alto) / 2
+    return mediana
+
+
+def _medias(grupos, valores, n_grupos):
+    validos = ~np.isnan(valores)
+    suma = np.bincount(grupos[validos], weights=valores[validos], minlength=n_grupos)
+    conteo = np.bincount(grupos[validos], minlength=n_grupos)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(conteo > 0, suma / conteo, np.nan)
+
+
+class RejillaHexagonal:
+    """Estadísticas por celda de una resolución."""
+
+    def __init__(self, x, y, radio, variables, ordenes):
+        self.radio = radio
+        q, r = a_hexagono(x, y, radio)
+        # (q, r) en una sola clave entera: np.unique 1D es mucho más rápido que axis=0
+        _, primera, self.celda_de_manzana = np.unique(q * 2**32 + r, return_index=True, return_inverse=True)
+        self.q, self.r = q[primera], r[primera]
+        n_celdas = len(primera)
+        self.conteo = np.bincount(self.celda_de_manzana, minlength=n_celdas)
+
+        self.media = {}
+        self.mediana = {}
+        for nombre, valores in variables.items():
+            self.media[nombre] = _medias(self.celda_de_manzana, valores, n_celdas)
+            self.mediana[nombre] = _medianas(self.celda_de_manzana, valores, n_celdas, ordenes[nombre])
+
+    def __len__(self):
+        return len(self.q)
+
+    def poligonos(self):
+        """Hexágonos de todas las celdas en EPSG:4326."""
+        cx, cy = centro_hexagono(self.q, self.r, self.radio)
+        angulos = np.deg2rad(30 + 60 * np.arange(7))
+        vertices = np.stack([cx[:, None] + self.radio * np.cos(angulos),
+                             cy[:, None] + self.radio * np.sin(angulos)], axis=2)
+        return gpd.GeoSeries(shapely.polygons(vertices), crs=f"EPSG:{CRS_METRICO}").to_crs(epsg=4326)
+
+    def tabla(self):
+        columnas = {"q": self.q, "r": self.r, "manzanas": self.conteo}
+        for nombre in self.media:
+            columnas[f"{nombre}_media"] = self.media[nombre]
+            columnas[f"{nombre}_mediana"] = self.mediana[nombre]
+        return pd.DataFrame(columnas)
+
+
+class AgregacionHexagonal:
+    """Rejillas de todas las ``RESOLUCIONES`` para la tabla de hechos."""
+
+    def __init__(self, manzanas):
+        with medir("agregacion_hexagonal"):
+            # Solo se proyectan los centroides; en una manzana la diferencia con
+            # el centroide calculado en metros es despreciable
+            centroides = gpd.GeoSeries(shapely.centroid(manzanas.geometry.values), crs=manzanas.crs)
+            centroides = centroides.to_crs(epsg=CRS_METRICO)
+            x, y = centroides.x.to_numpy(), centroides.y.to_numpy()
+
+            matriz = matriz_proyeccion(manzanas)
+            self._posiciones = matriz.posicion
+            rentabilidad = (pd.to_numeric(manzanas["rentabilidad"], errors="coerce").to_numpy(dtype=np.float64)
+                            if "rentabilidad" in manzanas.columns else np.full(len(manzanas), np.nan))
+            variables = {
+                "valor_m2": matriz.valores[:, 0].astype(np.float64),
+                "crecimiento": matriz.crecimiento_total.astype(np.float64),
+                "rentabilidad": rentabilidad,
+            }
+            validos = ~(np.isnan(x) | np.isnan(y))
+            x, y = x[validos], y[validos]
+            variables = {k: v[validos] for k, v in variables.items()}
+            ordenes = {k: np.argsort(v) for k, v in variables.items()}
+            self.rejillas = {nombre: RejillaHexagonal(x, y, radio, variables, ordenes)
+                             for nombre, radio in RESOLUCIONES.items()}
+            # Posición en la tabla de hechos → fila dentro de las rejillas (-1 sin geometría)
+            self._fila = np.full(len(manzanas), -1)
+            self._fila[validos] = np.arange(validos.sum())
+
+    def vecindario(self, manzana_id):
+        """Estadísticas de la celda de la manzana en cada resolución."""
+        pos = self._posiciones(manzana_id)
+        if pos is None or self._fila[pos] < 0:
+            return pd.DataFrame()
+        fila = self._fila[pos]
+        registros = []
+        for nombre, rejilla in self.rejillas.items():
+            celda = rejilla.celda_de_manzana[fila]
+            registros.append({
+                "resolucion": nombre,
+                "manzanas": int(rejilla.conteo[celda]),
+                "valor_m2_media": rejilla.media["valor_m2"][celda],
+                "valor_m2_mediana": rejilla.mediana["valor_m2"][celda],
+                "crecimiento_mediana": rejilla.mediana["crecimiento"][celda],
+                "rentabilidad_mediana": rejilla.mediana["rentabilidad"][celda],
+            })
+        return pd.DataFrame(registros)
+
+
+def agregacion_hexagonal(manzanas):
+    return por_version("hexagonos", manzanas, AgregacionHexagonal)
@@ -0,0 +1,206 @@
+"""Instrumentación de pasos y operaciones costosas de la app AVM.
+
+Registra tiempo de pared, tiempo de CPU, variación de memoria RSS y aciertos
+de caché por operación. Los datos se agregan en un registro global del
+proceso, se emiten como logs estructurados (JSON) y se exportan en formato
+de texto de Prometheus.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psutil
+
+logger = logging.getLogger("avm.metricas")
+
+_proceso = psutil.Process(os.getpid())
+_local = threading.local()
+
+
+def _rss():
+    return _proceso.memory_info().rss
+
+
+class RegistroMetricas:
+    """Acumula mediciones por operación de forma segura entre hilos."""
+
+    def __init__(self, max_eventos=500):
+        self._lock = threading.Lock()
+        self._agregados = {}
+        self._eventos = deque(maxlen=max_eventos)
+
+    def registrar(self, evento):
+        clave = (evento["operacion"], evento["paso"])
+        with self._lock:
+            agg = self._agregados.setdefault(clave, {
+                "operacion": evento["operacion"],
+                "paso": evento["paso"],
+                "llamadas": 0,
+                "errores": 0,
+                "wall_s": 0.0,
+                "cpu_s": 0.0,
+                "rss_delta_bytes": 0,
+                "wall_max_s": 0.0,
+                "cache_hits": 0,
+                "cache_misses": 0,
+            })
+            agg["llamadas"] += 1
+            agg["errores"] += int(evento["error"] is not None)
+            agg["wall_s"] += evento["wall_s"]
+            agg["cpu_s"] += evento["cpu_s"]
+            agg["rss_delta_bytes"] += evento["rss_delta_bytes"]
+            agg["wall_max_s"] = max(agg["wall_max_s"], evento["wall_s"])
+            if evento["cache"] == "hit":
+                agg["cache_hits"] += 1
+            elif evento["cache"] == "miss":
+                agg["cache_misses"] += 1
+            self._eventos.append(evento)
+
+    def agregados(self):
+        with self._lock:
+            return [dict(agg) for agg in self._agregados.values()]
+
+    def eventos(self, sesion=None):
+        with self._lock:
+            eventos = list(self._eventos)
+        if sesion is not None:
+            eventos = [e for e in eventos if e["sesion"] == sesion]
+        return eventos
+
+    def reiniciar(self):
+        with self._lock:
+            self._agregados.clear()
+            self._eventos.clear()
+
+
+registro = RegistroMetricas()
+
+
+def marcar_ejecucion(nombre):
+    """Se llama dentro de una función cacheada: si se ejecuta, fue un miss."""
+    ejecuciones = getattr(_local, "ejecuciones", None)
+    if ejecuciones is None:
+        ejecuciones = _local.ejecuciones = set()
+    ejecuciones.add(nombre)
+
+
+@contextmanager
+def medir(operacion, paso=None, sesion=None, cache=False):
+    """Mide el bloque y lo registra; con ``cache=True`` detecta hit/miss
+    según si la función cacheada llamó a ``marcar_ejecucion``."""
+    ejecuciones = getattr(_local, "ejecuciones", None)
+    if ejecuciones is None:
+        ejecuciones = _local.ejecuciones = set()
+    ejecuciones.discard(operacion)
+    if paso is None:
+        paso = getattr(_local, "paso", "")
+    if sesion is None:
+        sesion = getattr(_local, "sesion", "")
+
+    rss0 = _rss()
+    cpu0 = time.thread_time()
+    wall0 = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        # st.rerun()/st.stop() también se propagan como excepciones
+        if type(e).__name__ not in ("RerunException", "StopException"):
+            error = type(e).__name__
+        raise
+    finally:
+        evento = {
+            "ts": time.time(),
+            "sesion": sesion,
+            "paso": str(paso),
+            "operacion": operacion,
+            "wall_s": time.perf_counter() - wall0,
+            "cpu_s": time.thread_time() - cpu0,
+            "rss_delta_bytes": _rss() - rss0,
+            "cache": ("miss" if operacion in ejecuciones else "hit") if cache else None,
+            "error": error,
+        }
+        registro.registrar(evento)
+        logger.info(json.dumps(evento, ensure_ascii=False))
+
+
+@contextmanager
+def medir_paso(paso, sesion=""):
+    """Mide un paso completo y etiqueta con él las operaciones internas."""
+    anterior = getattr(_local, "paso", ""), getattr(_local, "sesion", "")
+    _local.paso, _local.sesion = str(paso), sesion
+    try:
+        with medir(f"paso_{paso}", paso=paso, sesion=sesion):
+            yield
+    finally:
+        _local.paso, _local.sesion = anterior
+
+
+def nuevo_id_sesion():
+    return uuid.uuid4().hex[:8]
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def exportar_prometheus():
+    """Devuelve los agregados en formato de exposición de texto de Prometheus."""
+    series = [
+        ("avm_operacion_llamadas_total", "counter", "Número de ejecuciones", "llamadas"),
+        ("avm_operacion_errores_total", "counter", "Ejecuciones con error", "errores"),
+        ("avm_operacion_wall_segundos_total", "counter", "Tiempo de pared acumulado", "wall_s"),
+        ("avm_operacion_cpu_segundos_total", "counter", "Tiempo de CPU acumulado", "cpu_s"),
+        ("avm_operacion_wall_max_segundos", "gauge", "Tiempo de pared máximo", "wall_max_s"),
+        ("avm_operacion_rss_delta_bytes_total", "counter", "Variación de RSS acumulada", "rss_delta_bytes"),
+        ("avm_cache_hits_total", "counter", "Aciertos de caché", "cache_hits"),
+        ("avm_cache_misses_total", "counter", "Fallos de caché", "cache_misses"),
+    ]
+    agregados = registro.agregados()
+    lineas = []
+    for nombre, tipo, ayuda, campo in series:
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+        for agg in agregados:
+            etiquetas = f'operacion="{_escapar(agg["operacion"])}",paso="{_escapar(agg["paso"])}"'
+            lineas.append(f"{nombre}{{{etiquetas}}} {agg[campo]}")
+    lineas.append("# HELP avm_proceso_rss_bytes Memoria residente del proceso")
+    lineas.append("# TYPE avm_proceso_rss_bytes gauge")
+    lineas.append(f"avm_proceso_rss_bytes {_rss()}")
+    return "\n".join(lineas) + "\n"
+
+
+def exportar_logs(sesion=None):
+    """Eventos recientes como JSON Lines."""
+    return "\n".join(json.dumps(e, ensure_ascii=False) for e in registro.eventos(sesion)) + "\n"
+
+
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        cuerpo = exportar_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def iniciar_servidor_metricas(puerto, host="127.0.0.1"):
+    """Expone ``/metrics`` en un hilo de fondo y devuelve el servidor."""
+    servidor = ThreadingHTTPServer((host, int(puerto)), _ManejadorMetricas)
+    hilo = threading.Thread(target=servidor.serve_forever, name="avm-metricas", daemon=True)
+    hilo.start()
+    return servidor
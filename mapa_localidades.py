@@ -0,0 +1,85 @@
+"""Mapa folium de localidades del paso 2, serializado una vez por versión.
+
+La capa de localidades se simplifica, lleva el estilo en las propiedades de
+cada entidad y se guarda como texto GeoJSON listo para enviar, compartido
+por todas las sesiones. En cada rerun solo se arma un ``folium.Map`` vacío
+que inserta ese texto tal cual: no hay ``style_function`` evaluada por
+entidad ni se vuelve a serializar la geometría. Como el script generado no
+cambia entre reruns, ``st_folium`` conserva el mapa ya dibujado en el
+navegador y un clic solo actualiza la selección.
+"""
+
+import json
+
+import folium
+import numpy as np
+import shapely
+from branca.element import MacroElement
+from jinja2 import Template
+
+from analisis import CRS_METRICO, por_version
+from instrumentacion import medir
+
+# Tolerancia de simplificación en metros: a zoom de ciudad no se aprecia
+TOLERANCIA_SIMPLIFICACION = 10
+ESTILO = {"fillColor": "#3388ff", "color": "black", "weight": 1, "fillOpacity": 0.2}
+ESTILO_RESALTADO = {"weight": 2, "color": "red"}
+
+
+class CapaGeoJsonSerializada(MacroElement):
+    """Capa GeoJSON a partir de texto ya serializado.
+
+    El estilo se lee de ``feature.properties.style``; el resaltado y la
+    etiqueta se resuelven en el navegador.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = L.geoJson({{ this.geojson }}, {
+            style: function(feature) { return feature.properties.style; },
+            onEachFeature: function(feature, layer) {
+                layer.bindTooltip(feature.properties.{{ this.campo_etiqueta }}, {sticky: true});
+                layer.on({
+                    mouseover: function(e) { e.target.setStyle({{ this.resaltado }}); },
+                    mouseout: function(e) { {{ this.get_name() }}.resetStyle(e.target); }
+                });
+            }
+        }).addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, geojson, campo_etiqueta, resaltado):
+        super().__init__()
+        self._name = "CapaGeoJsonSerializada"
+        self.geojson = geojson
+        self.campo_etiqueta = campo_etiqueta
+        self.resaltado = json.dumps(resaltado)
+
+
+def _geojson_localidades(localidades):
+    with medir("geojson_localidades"):
+        capa = localidades[["nombre_localidad", "geometry"]].to_crs(epsg=CRS_METRICO)
+        capa["geometry"] = capa.geometry.simplify(TOLERANCIA_SIMPLIFICACION, preserve_topology=True)
+        capa = capa.to_crs(epsg=4326)
+        # Seis decimales (~10 cm) bastan y acortan el texto
+        capa["geometry"] = shapely.transform(capa.geometry.values, lambda c: np.round(c, 6))
+        capa["style"] = [ESTILO] * len(capa)
+        return {
+            "geojson": capa.to_json(drop_id=True, separators=(",", ":")),
+            "bounds": localidades.total_bounds,
+        }
+
+
+def geojson_localidades(localidades):
+    """Texto GeoJSON de la capa de localidades (una vez por versión de datos)."""
+    return por_version("geojson_localidades", localidades, _geojson_localidades)
+
+
+def mapa_localidades(localidades):
+    """Mapa del paso 2. Es barato: la capa llega ya serializada."""
+    capa = geojson_localidades(localidades)
+    bounds = capa["bounds"]
+    center = [(bounds[1] + bounds[3]) / 2, (bounds[0] + bounds[2]) / 2]
+    mapa = folium.Map(location=center, zoom_start=11, tiles="CartoDB positron")
+    CapaGeoJsonSerializada(capa["geojson"], "nombre_localidad", ESTILO_RESALTADO).add_to(mapa)
+    return mapa
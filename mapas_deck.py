@@ -0,0 +1,243 @@
+"""Mapas de manzanas renderizados en el navegador con deck.gl (WebGL).
+
+En lugar de un GeoJSON con una entidad por manzana, las geometrías y los
+colores viajan como arreglos binarios (Float32/Uint32/Uint8 en base64) que
+deck.gl sube directamente a la GPU. El servidor solo concatena arreglos
+NumPy, sin serializar coordenadas una a una, y el navegador dibuja decenas
+de miles de manzanas con desplazamiento y zoom fluidos.
+
+Los mapas de manzanas se activan con ``AVM_MODO_MAPAS=deck``; el mapa de
+calor por hexágonos no tiene versión clásica y se usa siempre. La versión
+de deck.gl es la misma que fija ``pydeck``.
+"""
+
+import base64
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import pydeck as pdk
+import shapely
+from pydeck.frontend_semver import DECKGL_SEMVER
+
+from analisis import por_version
+from hexagonos import RESOLUCIONES, VARIABLES, agregacion_hexagonal
+from instrumentacion import medir
+from proyeccion import matriz_proyeccion
+
+DECKGL_URL = f"https://cdn.jsdelivr.net/npm/deck.gl@{DECKGL_SEMVER}/dist.min.js"
+TESELAS_URL = "https://tile.openstreetmap.org/{z}/{x}/{y}.png"
+COLOR_RESALTADO = (255, 0, 0, 230)
+
+
+def modo_deck():
+    return os.environ.get("AVM_MODO_MAPAS", "").lower() == "deck"
+
+
+def _b64(arreglo):
+    return base64.b64encode(np.ascontiguousarray(arreglo).tobytes()).decode("ascii")
+
+
+def colores_hex(colores, alpha=128):
+    """Colores ``#rrggbb`` por manzana a una matriz RGBA uint8 (N × 4)."""
+    colores = pd.Series(colores).fillna("#2b2b2b").astype(str)
+    unicos = colores.unique()
+    tabla = np.array([[int(c.lstrip("#")[i:i + 2], 16) for i in (0, 2, 4)] + [alpha] for c in unicos], dtype=np.uint8)
+    return tabla[pd.Index(unicos).get_indexer(colores)]
+
+
+def colores_continuos(valores, escala=px.colors.sequential.Viridis, alpha=160):
+    """Escala continua por cuantiles (p2–p98); los NaN quedan en gris."""
+    valores = np.asarray(valores, dtype=np.float64)
+    validos = ~np.isnan(valores)
+    rgba = np.full((len(valores), 4), (160, 160, 160, 60), dtype=np.uint8)
+    if validos.any():
+        bajo, alto = np.percentile(valores[validos], [2, 98])
+        t = np.clip((valores[validos] - bajo) / ((alto - bajo) or 1), 0, 1)
+        paleta = colores_hex(escala, alpha)
+        nodos = np.linspace(0, 1, len(paleta))
+        for canal in range(3):
+            rgba[validos, canal] = np.interp(t, nodos, paleta[:, canal])
+        rgba[validos, 3] = alpha
+    return rgba
+
+
+def _textos_binarios(textos):
+    """Textos UTF-8 de ancho fijo (rellenos con bytes nulos) y ese ancho."""
+    codificados = np.array([str(t).encode("utf-8") for t in textos], dtype=np.bytes_)
+    return _b64(codificados), max(codificados.itemsize, 1)
+
+
+def capa_binaria(manzanas, rgba, valores=None, conteo=None):
+    """Arreglos binarios de los anillos exteriores de las manzanas.
+
+    Cada parte de un MultiPolygon es un polígono de deck.gl; ``parte_manzana``
+    devuelve la manzana de cada polígono (tooltip y selección). Las
+    coordenadas se envían como desplazamientos en grados respecto a un
+    origen local, que en float32 conservan precisión submétrica. Los códigos
+    ``id_manzana_unif`` (si la capa los tiene) viajan como bytes UTF-8 de
+    ancho fijo y ``conteo`` como Uint32.
+    """
+    with medir("deck_capa_binaria"):
+        partes, manzana_de_parte = shapely.get_parts(manzanas.geometry.values, return_index=True)
+        anillos = shapely.get_exterior_ring(partes)
+        coords, parte_de_vertice = shapely.get_coordinates(anillos, return_index=True)
+        vertices = np.bincount(parte_de_vertice, minlength=len(partes))
+        inicios = (np.cumsum(vertices) - vertices).astype(np.uint32)
+
+        xmin, ymin, xmax, ymax = manzanas.total_bounds
+        origen = [(xmin + xmax) / 2, (ymin + ymax) / 2]
+        desplazamientos = (coords - origen).astype(np.float32)
+        colores = np.asarray(rgba, dtype=np.uint8)[manzana_de_parte[parte_de_vertice]]
+
+        vista = pdk.data_utils.compute_view([[xmin, ymin], [xmax, ymax]])
+        capa = {
+            "origen": [origen[0], origen[1], 0],
+            "posiciones": _b64(desplazamientos),
+            "inicios": _b64(inicios),
+            "colores": _b64(colores),
+            "parte_manzana": _b64(manzana_de_parte.astype(np.uint32)),
+            "vista": {"longitude": vista.longitude, "latitude": vista.latitude, "zoom": vista.zoom},
+        }
+        if "id_manzana_unif" in manzanas.columns:
+            capa["ids"], capa["ancho_ids"] = _textos_binarios(manzanas["id_manzana_unif"])
+        if conteo is not None:
+            capa["conteo"] = _b64(np.asarray(conteo, dtype=np.uint32))
+        if valores is not None:
+            capa["valores"] = _b64(np.asarray(valores, dtype=np.float32))
+    return capa
+
+
+def html_mapa(capa, alto=500, selector=False, nombre_valor="", formato_porcentaje=False, etiqueta="Manzana",
+              nombre_conteo=""):
+    """Documento HTML autocontenido para ``components.html``.
+
+    El tooltip muestra ``etiqueta`` con el código de la manzana (si la capa
+    trae ``ids``), el conteo y el valor, cuando existen.
+    """
+    caja_selector = """
+        <p><b>🔎 Código de la manzana seleccionada (¡copia este valor!):</b></p>
+        <input type="text" id="selected_id_input" value="" style="width: 100%; padding: 5px;" readonly>
+    """ if selector else ""
+    return f"""
+        <div id="mapa_deck" style="position: relative; height: {alto}px;"></div>
+        {caja_selector}
+        <script src="{DECKGL_URL}"></script>
+        <script>
+            const capa = {json.dumps(capa)};
+            function desdeBase64(texto, Tipo) {{
+                const binario = atob(texto);
+                const bytes = new Uint8Array(binario.length);
+                for (let i = 0; i < binario.length; i++) bytes[i] = binario.charCodeAt(i);
+                return new Tipo(bytes.buffer);
+            }}
+            const inicios = desdeBase64(capa.inicios, Uint32Array);
+            const parteManzana = desdeBase64(capa.parte_manzana, Uint32Array);
+            const valores = capa.valores ? desdeBase64(capa.valores, Float32Array) : null;
+            const conteo = capa.conteo ? desdeBase64(capa.conteo, Uint32Array) : null;
+            const idsBytes = capa.ids ? desdeBase64(capa.ids, Uint8Array) : null;
+            const decodificador = new TextDecoder();
+            function idManzana(i) {{
+                const texto = decodificador.decode(idsBytes.subarray(i * capa.ancho_ids, (i + 1) * capa.ancho_ids));
+                return texto.replace(/\\0+$/, "");
+            }}
+            const porcentaje = {json.dumps(formato_porcentaje)};
+
+            const fondo = new deck.TileLayer({{
+                id: "fondo",
+                data: "{TESELAS_URL}",
+                minZoom: 0,
+                maxZoom: 19,
+                tileSize: 256,
+                renderSubLayers: props => {{
+                    const [[oeste, sur], [este, norte]] = props.tile.boundingBox;
+                    return new deck.BitmapLayer(props, {{data: null, image: props.data, bounds: [oeste, sur, este, norte]}});
+                }}
+            }});
+
+            const manzanas = new deck.SolidPolygonLayer({{
+                id: "manzanas",
+                data: {{
+                    length: inicios.length,
+                    startIndices: inicios,
+                    attributes: {{
+                        getPolygon: {{value: desdeBase64(capa.posiciones, Float32Array), size: 2}},
+                        getFillColor: {{value: desdeBase64(capa.colores, Uint8Array), size: 4}}
+                    }}
+                }},
+                _normalize: false,
+                positionFormat: "XY",
+                coordinateSystem: deck.COORDINATE_SYSTEM.LNGLAT_OFFSETS,
+                coordinateOrigin: capa.origen,
+                pickable: true,
+                autoHighlight: true,
+                highlightColor: [255, 165, 0, 200]
+            }});
+
+            function texto(i) {{
+                let t = idsBytes ? "{etiqueta}: " + idManzana(i) : "{etiqueta}";
+                if (conteo) t += "\\n{nombre_conteo}: " + conteo[i].toLocaleString("es-CO");
+                if (valores && !Number.isNaN(valores[i])) {{
+                    const v = porcentaje ? (valores[i] * 100).toFixed(1) + "%" : valores[i].toLocaleString("es-CO");
+                    t += "\\n{nombre_valor}: " + v;
+                }}
+                return t;
+            }}
+
+            new deck.DeckGL({{
+                container: "mapa_deck",
+                initialViewState: capa.vista,
+                controller: true,
+                layers: [fondo, manzanas],
+                getTooltip: ({{layer, index}}) => layer && layer.id === "manzanas" && index >= 0 ? texto(parteManzana[index]) : null,
+                onClick: ({{layer, index}}) => {{
+                    const caja = document.getElementById("selected_id_input");
+                    if (caja && idsBytes && layer && layer.id === "manzanas" && index >= 0) caja.value = idManzana(parteManzana[index]);
+                }}
+            }});
+        </script>
+    """
+
+
+# --- Mapas de la app ---
+def mapa_selector(manzanas_sel, alto=500):
+    """Paso 3: manzanas de la localidad por uso POT; el clic muestra el código."""
+    return html_mapa(capa_binaria(manzanas_sel, colores_hex(manzanas_sel["color"])), alto, selector=True)
+
+
+def mapa_resumen(manzanas_sel, manzana_id, alto=450):
+    """Paso 7: manzanas de la localidad con la seleccionada resaltada."""
+    rgba = colores_hex(manzanas_sel["color"])
+    rgba[(manzanas_sel["id_manzana_unif"] == manzana_id).to_numpy()] = COLOR_RESALTADO
+    return html_mapa(capa_binaria(manzanas_sel, rgba), alto)
+
+
+def _mapa_ciudad(manzanas):
+    matriz = matriz_proyeccion(manzanas)
+    capa = capa_binaria(manzanas, colores_continuos(matriz.crecimiento_total), matriz.crecimiento_total)
+    return html_mapa(capa, 600, nombre_valor="Crecimiento 2024-S2 → 2026-S2", formato_porcentaje=True)
+
+
+def mapa_ciudad(manzanas):
+    """Todas las manzanas coloreadas por crecimiento proyectado (una vez por versión)."""
+    return por_version("deck_ciudad", manzanas, _mapa_ciudad)
+
+
+def _mapa_hexagonos(manzanas, resolucion, variable):
+    rejilla = agregacion_hexagonal(manzanas).rejillas[resolucion]
+    mediana = rejilla.mediana[variable]
+    capa = capa_binaria(gpd.GeoDataFrame(geometry=rejilla.poligonos()), colores_continuos(mediana, alpha=170),
+                        mediana, conteo=rejilla.conteo)
+    return html_mapa(capa, 600, nombre_valor=f"{VARIABLES[variable]} (mediana)",
+                     formato_porcentaje=variable == "crecimiento", etiqueta="Hexágono", nombre_conteo="Manzanas")
+
+
+def mapa_hexagonos(manzanas, resolucion, variable):
+    """Mapa de calor por hexágonos (una vez por versión, resolución y variable)."""
+    if resolucion not in RESOLUCIONES or variable not in VARIABLES:
+        raise ValueError(f"Resolución o variable no válida: {resolucion}, {variable}")
+    return por_version(f"deck_hexagonos:{resolucion}:{variable}", manzanas,
+                       lambda m: _mapa_hexagonos(m, resolucion, variable))
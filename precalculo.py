@@ -0,0 +1,193 @@
+"""Precálculo especulativo de los pasos 4–7 mientras el usuario lee el actual.
+
+El flujo es lineal: en cuanto un paso tiene sus entradas (p. ej. la manzana
+confirmada en el paso 3) se lanza en segundo plano el cálculo del siguiente
+(buffers, figuras y PNG). Cuando el usuario pulsa «Continuar», el paso
+recoge el resultado ya calculado o espera a que termine; si la clave no
+coincide (otra manzana, otra versión de datos) lo calcula en línea.
+
+Cada sesión tiene su propio ``Precalculo`` (tareas, claves y cancelación);
+los hilos salen de un pool acotado compartido por el proceso.
+"""
+
+import logging
+import threading
+from concurrent.futures import Future
+
+import analisis
+import figuras
+from hexagonos import agregacion_hexagonal
+from instrumentacion import marcar_ejecucion, medir, medir_paso
+from proyeccion import matriz_proyeccion
+
+logger = logging.getLogger("avm.precalculo")
+
+
+class Cancelado(Exception):
+    pass
+
+
+def comprobar(cancelado):
+    if cancelado is not None and cancelado.is_set():
+        raise Cancelado()
+
+
+# --- Cálculo de cada paso (sin Streamlit) ---
+def calcular_paso_4(manzanas, transporte, colegios, manzana_id, cancelado=None):
+    manzana_sel = manzanas[manzanas["id_manzana_unif"] == manzana_id]
+    if manzana_sel.empty:
+        return None
+    contexto = analisis.contexto_espacial(manzana_sel, transporte, colegios)
+    comprobar(cancelado)
+    fig_transporte = figuras.figura_transporte(contexto)
+    buffer_transporte = figuras.a_png(fig_transporte, "transporte")
+    comprobar(cancelado)
+    fig_colegios = figuras.figura_colegios(contexto)
+    buffer_colegios = figuras.a_png(fig_colegios, "colegios")
+    return {
+        "manzana_sel": manzana_sel,
+        "fig_transporte": fig_transporte,
+        "buffer_transporte": buffer_transporte,
+        "fig_colegios": fig_colegios,
+        "buffer_colegios": buffer_colegios,
+    }
+
+
+def calcular_paso_5(localidades, manzanas, manzanas_localidad_sel, color_map, manzana_id, cancelado=None):
+    if not (manzanas_localidad_sel["id_manzana_unif"] == manzana_id).any():
+        return None
+    comparativo = analisis.comparativo_valor(manzanas_localidad_sel, manzana_id)
+    nombre_localidad = analisis.nombre_de_localidad(localidades, comparativo["cod_localidad"])
+    comprobar(cancelado)
+    fig_valor = figuras.figura_comparativo(comparativo)
+    resultado = {
+        "comparativo": comparativo,
+        "nombre_localidad": nombre_localidad,
+        "ficha_estilizada": analisis.ficha_estilizada(comparativo, manzana_id, nombre_localidad),
+        "fig_valor": fig_valor,
+        "buffer_valorm2": figuras.a_png(fig_valor, "valorm2"),
+        "fig_pie": None,
+        "buffer_dist_pot": None,
+        "fig_line": None,
+        "buffer_proyeccion": None,
+    }
+    comprobar(cancelado)
+    if not comparativo["conteo_uso"].empty:
+        resultado["fig_pie"] = figuras.figura_distribucion_pot(comparativo["conteo_uso"], color_map, manzana_id)
+        resultado["buffer_dist_pot"] = figuras.a_png(resultado["fig_pie"], "dist_pot")
+    comprobar(cancelado)
+    matriz = matriz_proyeccion(manzanas)
+    resultado["proyeccion"] = matriz.metricas(manzana_id)
+    resultado["vecindario"] = agregacion_hexagonal(manzanas).vecindario(manzana_id)
+    if resultado["proyeccion"] is not None and resultado["proyeccion"]["completa"]:
+        resultado["fig_line"] = figuras.figura_proyeccion(matriz.serie(manzana_id), manzana_id)
+        resultado["buffer_proyeccion"] = figuras.a_png(resultado["fig_line"], "proyeccion")
+    return resultado
+
+
+def calcular_paso_6(localidades, manzanas_localidad_sel, manzana_id, cancelado=None):
+    manzana_sel = manzanas_localidad_sel[manzanas_localidad_sel["id_manzana_unif"] == manzana_id]
+    if manzana_sel.empty:
+        return None
+    df_seguridad = analisis.tabla_seguridad(localidades, manzana_sel["num_localidad"].values[0])
+    comprobar(cancelado)
+    fig = figuras.figura_seguridad(df_seguridad)
+    return {"df_seguridad": df_seguridad, "fig": fig, "buffer_seguridad": figuras.a_png(fig, "seguridad")}
+
+
+def calcular_paso_7(manzanas_localidad_sel, color_map, cancelado=None):
+    if manzanas_localidad_sel.empty:
+        return None
+    fig_manzanas = figuras.figura_manzanas(manzanas_localidad_sel, color_map)
+    comprobar(cancelado)
+    return {"fig_manzanas": fig_manzanas, "buffer_manzanas": figuras.a_png(fig_manzanas, "manzanas")}
+
+
+CALCULOS = {4: calcular_paso_4, 5: calcular_paso_5, 6: calcular_paso_6, 7: calcular_paso_7}
+
+
+def _argumentos(paso, estado):
+    if paso == 4:
+        return estado["manzanas"], estado["transporte"], estado["colegios"], estado["manzana_sel"]
+    if paso == 5:
+        return (estado["localidades"], estado["manzanas"], estado["manzanas_localidad_sel"],
+                estado["color_map"], estado["manzana_sel"])
+    if paso == 6:
+        return estado["localidades"], estado["manzanas_localidad_sel"], estado["manzana_sel"]
+    return estado["manzanas_localidad_sel"], estado["color_map"]
+
+
+def _clave(estado):
+    return estado["manzana_sel"], analisis.version_datos(estado["manzanas"])
+
+
+class Precalculo:
+    """Tareas especulativas de una sesión, una por paso."""
+
+    def __init__(self, ejecutor, sesion=""):
+        self._ejecutor = ejecutor
+        self._sesion = sesion
+        self._tareas = {}
+        self._lock = threading.Lock()
+
+    def _ejecutar(self, paso, args, cancelado):
+        comprobar(cancelado)
+        with medir_paso(f"{paso}_precalculo", self._sesion):
+            return CALCULOS[paso](*args, cancelado=cancelado)
+
+    def lanzar(self, estado, *pasos):
+        """Lanza en segundo plano los pasos indicados con las entradas actuales
+        de ``estado`` (``st.session_state``); no repite tareas ya lanzadas."""
+        clave = _clave(estado)
+        with self._lock:
+            for paso in pasos:
+                tarea = self._tareas.get(paso)
+                if tarea is not None and tarea[0] == clave:
+                    continue
+                if tarea is not None:
+                    self._cancelar(tarea)
+                cancelado = threading.Event()
+                futuro = self._ejecutor.submit(self._ejecutar, paso, _argumentos(paso, estado), cancelado)
+                self._tareas[paso] = (clave, futuro, cancelado)
+
+    def obtener(self, paso, estado):
+        """Resultado del paso para las entradas actuales: el precalculado si
+        existe (esperándolo si ya está corriendo) o calculado aquí mismo. Una
+        tarea que sigue en la cola del pool compartido se cancela y se calcula
+        aquí, sin esperar el trabajo especulativo de otras sesiones. None si
+        la manzana no está en los datos o el cálculo falla."""
+        clave = _clave(estado)
+        with self._lock:
+            tarea = self._tareas.get(paso)
+        with medir(f"precalculo_paso_{paso}", cache=True):
+            if tarea is not None and tarea[0] == clave and not tarea[1].cancel():
+                try:
+                    return tarea[1].result()
+                except Exception:
+                    pass
+            marcar_ejecucion(f"precalculo_paso_{paso}")
+            try:
+                resultado = CALCULOS[paso](*_argumentos(paso, estado))
+            except Exception:
+                # El paso muestra su aviso de «sin datos» en lugar de romper la página
+                logger.exception("Fallo al calcular el paso %s", paso)
+                return None
+
+        # Se guarda como tarea terminada para que los reruns del paso no recalculen
+        futuro = Future()
+        futuro.set_result(resultado)
+        with self._lock:
+            self._tareas[paso] = (clave, futuro, threading.Event())
+        return resultado
+
+    @staticmethod
+    def _cancelar(tarea):
+        tarea[2].set()
+        tarea[1].cancel()
+
+    def cancelar(self):
+        """Descarta todas las tareas (al volver atrás o cambiar de manzana)."""
+        with self._lock:
+            for tarea in self._tareas.values():
+                self._cancelar(tarea)
+            self._tareas.clear()
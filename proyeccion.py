@@ -0,0 +1,88 @@
+"""Motor de proyección del valor m² para todas las manzanas.
+
+La serie 2024-S2 … 2026-S2 de la tabla de hechos se guarda como una matriz
+densa float32 (manzanas × periodos) y todas las métricas derivadas se
+calculan de una vez, vectorizadas, al construirla. Hay una matriz por
+versión de datos, compartida entre sesiones; los pasos 5 y 7, el cribado y
+las comparaciones leen de ella en lugar de volver a extraer columnas.
+"""
+
+import numpy as np
+import pandas as pd
+
+from analisis import COLUMNAS_PROYECCION, PERIODOS, por_version
+from instrumentacion import medir
+
+# Los periodos son semestrales: 4 semestres entre 2024-S2 y 2026-S2
+AÑOS_PROYECCION = (len(PERIODOS) - 1) / 2
+
+
+def _percentil_por_grupo(valores, grupos):
+    """Rango percentil (0–100] de cada valor dentro de su grupo; NaN si falta
+    el valor o el grupo."""
+    serie = pd.Series(valores, dtype="float64")
+    percentil = serie.groupby(pd.Series(grupos), dropna=True).rank(pct=True) * 100
+    return percentil.to_numpy(dtype=np.float32, na_value=np.nan)
+
+
+class MatrizProyeccion:
+    """Serie de valor m² y métricas de proyección de todas las manzanas."""
+
+    def __init__(self, manzanas):
+        with medir("matriz_proyeccion"):
+            self.ids = manzanas["id_manzana_unif"].to_numpy()
+            ids = pd.Index(self.ids)
+            self._posiciones = pd.Series(np.arange(len(ids)), index=ids)[~ids.duplicated()]
+
+            self.valores = np.column_stack([
+                pd.to_numeric(manzanas[c], errors="coerce").to_numpy(dtype=np.float32, na_value=np.nan)
+                for c in COLUMNAS_PROYECCION
+            ])
+            # Un valor m² nulo o negativo equivale a un dato faltante (NaN no supera 0)
+            self.completa = (self.valores > 0).all(axis=1)
+
+            inicial, final = self.valores[:, 0], self.valores[:, -1]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                self.crecimiento_semestral = self.valores[:, 1:] / self.valores[:, :-1] - 1
+                self.crecimiento_total = final / inicial - 1
+                self.cagr = np.power(final / inicial, 1 / AÑOS_PROYECCION) - 1
+            # Sin valor inicial positivo no hay crecimiento definido (evita inf en rankings y mapas)
+            self.crecimiento_semestral[~(self.valores[:, :-1] > 0)] = np.nan
+            self.crecimiento_total[~(inicial > 0)] = np.nan
+            self.cagr[~(inicial > 0)] = np.nan
+            self.volatilidad = np.full(len(ids), np.nan, dtype=np.float32)
+            self.volatilidad[self.completa] = self.crecimiento_semestral[self.completa].std(axis=1)
+
+            self.percentil_localidad = _percentil_por_grupo(self.crecimiento_total, manzanas["num_localidad"].to_numpy())
+            self.percentil_area = _percentil_por_grupo(self.crecimiento_total, manzanas["id_area"].to_numpy())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def posicion(self, manzana_id):
+        pos = self._posiciones.get(manzana_id)
+        return None if pos is None else int(pos)
+
+    def serie(self, manzana_id):
+        """Valores por periodo (``PERIODOS``) de una manzana, o None si no existe."""
+        pos = self.posicion(manzana_id)
+        return None if pos is None else self.valores[pos]
+
+    def metricas(self, manzana_id):
+        pos = self.posicion(manzana_id)
+        if pos is None:
+            return None
+        return {
+            "serie": dict(zip(PERIODOS, self.valores[pos].tolist())),
+            "completa": bool(self.completa[pos]),
+            "crecimiento_total": float(self.crecimiento_total[pos]),
+            "cagr": float(self.cagr[pos]),
+            "volatilidad": float(self.volatilidad[pos]),
+            "percentil_localidad": float(self.percentil_localidad[pos]),
+            "percentil_area": float(self.percentil_area[pos]),
+        }
+
+
+def matriz_proyeccion(manzanas):
+    """Matriz de la tabla de hechos completa (``st.session_state.manzanas``)."""
+    return por_version("proyeccion", manzanas, MatrizProyeccion)
@@ -0,0 +1,255 @@
+"""Generador de carga: N analistas simulados recorren los pasos 2–7 en paralelo.
+
+Cada sesión simulada es un hilo (igual que el script runner de Streamlit),
+elige localidades y manzanas al azar y ejecuta la misma lógica que la app,
+sin interfaz y sin red: los pasos 4–7 son los ``calcular_paso_N`` de
+``precalculo`` y pasan por ``Precalculo`` con un pool compartido. Por
+defecto los PNG se rasterizan con matplotlib sin teselas de fondo, así que
+la prueba no necesita red; ``--render kaleido`` usa el backend de la app.
+Si algún recorrido falla no se publican percentiles y el proceso sale con 1.
+
+    python prueba_carga.py --sesiones 8 --recorridos 5
+    python prueba_carga.py --sesiones 16 --datos datos_prueba/ --render ninguno --json resultado.json
+    python prueba_carga.py --sesiones 8 --espera 2 --hilos-precalculo 4
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+import psutil
+
+import analisis
+import figuras
+from datos_prueba import generar_datasets, leer_geojson
+from informe import generar_informe
+from instrumentacion import medir_paso, registro
+from precalculo import Precalculo
+
+PASOS = [2, 3, 4, 5, 6, 7]
+RENDERS = ["matplotlib", "ninguno", "kaleido"]
+
+
+class MuestreadorMemoria(threading.Thread):
+    """Registra el pico de RSS del proceso mientras dura la prueba."""
+
+    def __init__(self, intervalo=0.02):
+        super().__init__(daemon=True)
+        self.intervalo = intervalo
+        self.proceso = psutil.Process()
+        self.pico = self.proceso.memory_info().rss
+        self._fin = threading.Event()
+
+    def run(self):
+        while not self._fin.wait(self.intervalo):
+            self.pico = max(self.pico, self.proceso.memory_info().rss)
+
+    def detener(self):
+        self._fin.set()
+        self.join()
+
+
+def recorrido(datos, rng, sesion, precalculo, latencias, espera=0.0):
+    """Un analista completo: localidad → manzana → pasos 4 a 7.
+
+    Los pasos 4–7 pasan por ``Precalculo`` igual que en la app: al confirmar
+    la manzana se lanzan 4 y 5, y cada paso recoge su resultado y lanza el
+    siguiente. ``espera`` simula el tiempo de lectura entre pasos, que es el
+    que aprovecha el precálculo.
+    """
+    localidades = datos["localidades"]
+    estado = dict(datos)
+    resultados = {}
+
+    def paso(n, funcion):
+        t0 = time.perf_counter()
+        with medir_paso(n, sesion):
+            funcion()
+        latencias[n].append(time.perf_counter() - t0)
+        if espera:
+            time.sleep(espera)
+
+    def paso_2():
+        punto = localidades.geometry.iloc[rng.integers(len(localidades))].representative_point()
+        estado["localidad_sel"] = analisis.localidad_en_punto(localidades, punto.x, punto.y)
+
+    def paso_3():
+        fig_localidad, _ = figuras.figura_localidad(localidades, estado["localidad_sel"])
+        estado["buffer_localidad"] = figuras.a_png(fig_localidad, "localidad")
+        cod_localidad = analisis.codigo_localidad(localidades, estado["localidad_sel"])
+        manzanas_sel, color_map = analisis.manzanas_de_localidad(datos["areas"], datos["manzanas"], cod_localidad)
+        json.dumps(analisis.geojson_manzanas(manzanas_sel))
+        estado["manzanas_localidad_sel"] = manzanas_sel
+        estado["color_map"] = color_map
+        estado["manzana_sel"] = manzanas_sel["id_manzana_unif"].iloc[rng.integers(len(manzanas_sel))]
+        precalculo.lanzar(estado, 4, 5)
+
+    def paso_precalculado(n):
+        def funcion():
+            resultados[n] = precalculo.obtener(n, estado)
+            if resultados[n] is None:
+                raise RuntimeError(f"paso {n} sin resultado para la manzana {estado['manzana_sel']}")
+            if n < 7:
+                precalculo.lanzar(estado, n + 1)
+        return funcion
+
+    def paso_7():
+        paso_precalculado(7)()
+        paso_5 = resultados[5]
+        comparativo = paso_5["comparativo"]
+        imagenes = {
+            "colegios": resultados[4]["buffer_colegios"],
+            "transporte": resultados[4]["buffer_transporte"],
+            "dist_pot": paso_5["buffer_dist_pot"] or BytesIO(),
+            "mapa_pot": paso_5["buffer_dist_pot"] or BytesIO(),
+            "manzanas": resultados[7]["buffer_manzanas"],
+            "valorm2": paso_5["buffer_valorm2"],
+            "seguridad": resultados[6]["buffer_seguridad"],
+            "proyeccion": paso_5["buffer_proyeccion"] or BytesIO(),
+            "localidad": estado["buffer_localidad"],
+        }
+        generar_informe(
+            comparativo["manzana_sel"], paso_5["nombre_localidad"], datos["areas"],
+            comparativo["promedio_area"], comparativo["promedio_buffer"],
+            comparativo["uso_pot_mayoritario"], resultados[6]["df_seguridad"], imagenes,
+            paso_5["ficha_estilizada"], paso_5["proyeccion"],
+        )
+
+    funciones = [paso_2, paso_3, paso_precalculado(4), paso_precalculado(5), paso_precalculado(6), paso_7]
+    try:
+        for n, funcion in zip(PASOS, funciones):
+            paso(n, funcion)
+    finally:
+        precalculo.cancelar()
+
+
+def ejecutar(datos, sesiones, recorridos, render="matplotlib", semilla=0, espera=0.0, hilos_precalculo=4):
+    """Lanza las sesiones en paralelo y devuelve el resumen de la prueba.
+
+    ``render`` es el backend de ``figuras``; con matplotlib se desactivan las
+    teselas de fondo para no depender de la red.
+    """
+    latencias = defaultdict(list)
+    errores = []
+    lock = threading.Lock()
+    barrera = threading.Barrier(sesiones)
+    # Pool de precálculo compartido por las sesiones, como en la app
+    ejecutor = ThreadPoolExecutor(max_workers=hilos_precalculo, thread_name_prefix="avm-precalculo")
+    backend = figuras.BACKEND_RENDER
+    figuras.BACKEND_RENDER = render
+    if render == "matplotlib":
+        import rasterizador
+        teselas, rasterizador.TESELAS_ACTIVAS = rasterizador.TESELAS_ACTIVAS, False
+
+    def sesion(i):
+        rng = np.random.default_rng(semilla + i)
+        locales = defaultdict(list)
+        precalculo = Precalculo(ejecutor, f"sim{i:03d}")
+        barrera.wait()
+        for _ in range(recorridos):
+            try:
+                recorrido(datos, rng, f"sim{i:03d}", precalculo, locales, espera)
+            except Exception as e:
+                errores.append(f"sesión {i}: {type(e).__name__}: {e}")
+        with lock:
+            for n, valores in locales.items():
+                latencias[n].extend(valores)
+
+    registro.reiniciar()
+    memoria = MuestreadorMemoria()
+    rss_inicial = memoria.pico
+    memoria.start()
+    hilos = [threading.Thread(target=sesion, args=(i,), name=f"sim{i:03d}") for i in range(sesiones)]
+    t0 = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - t0
+    memoria.detener()
+    ejecutor.shutdown()
+    figuras.BACKEND_RENDER = backend
+    if render == "matplotlib":
+        rasterizador.TESELAS_ACTIVAS = teselas
+
+    pasos = {}
+    for n in PASOS:
+        valores = np.array(latencias.get(n, []))
+        if valores.size:
+            p50, p95, p99 = np.percentile(valores, [50, 95, 99]) * 1000
+            pasos[n] = {"n": int(valores.size), "p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "max_ms": valores.max() * 1000}
+
+    completos = len(latencias.get(PASOS[-1], []))
+    return {
+        "sesiones": sesiones,
+        "recorridos_por_sesion": recorridos,
+        "render": render,
+        "espera_s": espera,
+        "duracion_s": duracion,
+        "recorridos_completos": completos,
+        "throughput_recorridos_s": completos / duracion if duracion else 0.0,
+        "throughput_pasos_s": sum(p["n"] for p in pasos.values()) / duracion if duracion else 0.0,
+        "rss_inicial_mb": rss_inicial / 2**20,
+        "rss_pico_mb": memoria.pico / 2**20,
+        "pasos": pasos,
+        "operaciones": sorted(registro.agregados(), key=lambda a: -a["wall_s"])[:15],
+        "errores": errores,
+    }
+
+
+def imprimir(resumen):
+    print(f"\nSesiones: {resumen['sesiones']}  recorridos/sesión: {resumen['recorridos_por_sesion']}  "
+          f"render PNG: {resumen['render']}  espera entre pasos: {resumen['espera_s']:g} s")
+    print(f"Duración: {resumen['duracion_s']:.2f} s  recorridos completos: {resumen['recorridos_completos']}  "
+          f"throughput: {resumen['throughput_recorridos_s']:.2f} recorridos/s ({resumen['throughput_pasos_s']:.2f} pasos/s)")
+    print(f"RSS: inicial {resumen['rss_inicial_mb']:.0f} MB, pico {resumen['rss_pico_mb']:.0f} MB\n")
+    if resumen["errores"]:
+        # Con recorridos fallidos las latencias solo cubren los pasos que se alcanzaron
+        print(f"{len(resumen['errores'])} recorridos con error; no se publican percentiles.")
+        for error in resumen["errores"][:5]:
+            print(f"  {error}")
+        return
+    print(f"{'paso':>5} {'n':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for n, p in resumen["pasos"].items():
+        print(f"{n:>5} {p['n']:>6} {p['p50_ms']:>10.1f} {p['p95_ms']:>10.1f} {p['p99_ms']:>10.1f} {p['max_ms']:>10.1f}")
+    print(f"\n{'operación':<32} {'llamadas':>8} {'wall total s':>13} {'wall max s':>11}")
+    for op in resumen["operaciones"]:
+        print(f"{op['operacion']:<32} {op['llamadas']:>8} {op['wall_s']:>13.2f} {op['wall_max_s']:>11.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga de los pasos 2–7 con sesiones concurrentes.")
+    parser.add_argument("--sesiones", type=int, default=4, help="analistas simultáneos")
+    parser.add_argument("--recorridos", type=int, default=3, help="recorridos completos por sesión")
+    parser.add_argument("--datos", help="carpeta con los GeoJSON (por defecto se generan datos sintéticos)")
+    parser.add_argument("--manzanas-por-lado", type=int, default=20, help="tamaño de los datos sintéticos")
+    parser.add_argument("--render", choices=RENDERS, default="matplotlib",
+                        help="backend PNG (matplotlib sin teselas por defecto; kaleido necesita red)")
+    parser.add_argument("--sin-render", action="store_const", dest="render", const="ninguno",
+                        help="equivale a --render ninguno")
+    parser.add_argument("--espera", type=float, default=0.0, help="segundos de lectura entre pasos")
+    parser.add_argument("--hilos-precalculo", type=int, default=4, help="tamaño del pool de precálculo")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--json", help="guarda el resumen en este archivo")
+    args = parser.parse_args()
+
+    if args.datos:
+        datos = leer_geojson(args.datos)
+    else:
+        datos = generar_datasets(manzanas_por_lado=args.manzanas_por_lado, semilla=args.semilla)
+    print(f"{len(datos['manzanas'])} manzanas, {len(datos['localidades'])} localidades")
+
+    resumen = ejecutar(datos, args.sesiones, args.recorridos, args.render, args.semilla,
+                       args.espera, args.hilos_precalculo)
+    imprimir(resumen)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resumen, f, indent=2, default=str)
+    if resumen["errores"]:
+        sys.exit(1)
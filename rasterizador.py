@@ -0,0 +1,506 @@
+"""Rasterizador de figuras Plotly a PNG con matplotlib (Agg), sin Chromium.
+
+Alternativa a kaleido para las imágenes del informe: recorre las trazas de
+las figuras que construye ``figuras`` (Scattermapbox, Choroplethmapbox, Bar,
+Pie y Scatter) y las dibuja en el propio proceso. Los mapas usan la misma
+proyección y zoom que Mapbox, con teselas raster de fondo cacheadas en
+disco; sin red se dibujan sobre fondo liso.
+
+Se elige por despliegue con ``AVM_RENDER_BACKEND=matplotlib`` (por defecto
+kaleido). Comparativa de tiempos:
+
+    python rasterizador.py --repeticiones 5 --salida /tmp/png
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+import numpy as np
+import requests
+from PIL import Image
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+from matplotlib.colors import LinearSegmentedColormap, Normalize, to_rgba
+from matplotlib.figure import Figure
+from matplotlib.ticker import FuncFormatter, PercentFormatter
+
+logger = logging.getLogger("avm.render")
+
+# Tamaño por defecto de plotly.io.write_image
+ANCHO, ALTO = 700, 500
+DPI = 100
+# Ancho medio en píxeles de un carácter de las marcas (DejaVu Sans 10 pt a 100 dpi)
+PX_CARACTER = 7.5
+
+TESELAS_URL = os.environ.get("AVM_TESELAS_URL", "https://a.basemaps.cartocdn.com/light_all/{z}/{x}/{y}.png")
+TESELAS_DIR = os.environ.get("AVM_TESELAS_DIR", os.path.join(os.path.expanduser("~"), ".cache", "avm_teselas"))
+TESELAS_ACTIVAS = os.environ.get("AVM_TESELAS", "true") != "false"
+# Tras un fallo de red no se vuelve a intentar durante este tiempo (segundos)
+PAUSA_SIN_RED = 60
+# Teselas decodificadas en memoria (256 KB cada una en uint8)
+MAX_TESELAS_MEMORIA = 64
+
+_RGBA = re.compile(r"rgba?\(([^)]*)\)")
+_sin_red_hasta = 0.0
+_lock_red = threading.Lock()
+_teselas = OrderedDict()
+_lock_teselas = threading.Lock()
+
+
+def color(valor, alpha=1.0):
+    """Color de Plotly (nombre CSS, ``#hex``, ``rgb()``/``rgba()``) a RGBA de matplotlib."""
+    m = _RGBA.fullmatch(str(valor).replace(" ", ""))
+    if m:
+        partes = [float(p) for p in m.group(1).split(",")]
+        rgba = (partes[0] / 255, partes[1] / 255, partes[2] / 255, partes[3] if len(partes) > 3 else 1.0)
+    else:
+        rgba = to_rgba(valor)
+    return rgba[:3] + (rgba[3] * alpha,)
+
+
+def _colores(valor, n, por_defecto, alpha=1.0):
+    """Lista de ``n`` colores a partir de un color único, una lista o nada."""
+    if valor is None:
+        return [color(por_defecto, alpha)] * n
+    if isinstance(valor, str):
+        return [color(valor, alpha)] * n
+    return [color(v, alpha) for v in valor]
+
+
+def _texto(valor):
+    return "" if valor is None else str(valor).replace("<br>", "\n")
+
+
+def _colorway(fig):
+    return list(fig.layout.colorway or fig.layout.template.layout.colorway or ["#636efa"])
+
+
+# --- Teselas de fondo ---
+def _tesela(z, x, y):
+    """Imagen RGBA (uint8) de una tesela (memoria → disco → red), o None si no
+    está disponible. Solo se guardan en memoria las lecturas correctas: una
+    tesela que falló se vuelve a pedir cuando termina la pausa sin red."""
+    clave = (z, x, y)
+    with _lock_teselas:
+        if clave in _teselas:
+            _teselas.move_to_end(clave)
+            return _teselas[clave]
+    imagen = _leer_tesela(z, x, y)
+    if imagen is not None:
+        with _lock_teselas:
+            _teselas[clave] = imagen
+            while len(_teselas) > MAX_TESELAS_MEMORIA:
+                _teselas.popitem(last=False)
+    return imagen
+
+
+def _leer_tesela(z, x, y):
+    global _sin_red_hasta
+    ruta = os.path.join(TESELAS_DIR, str(z), str(x), f"{y}.png")
+    if not os.path.exists(ruta):
+        if time.time() < _sin_red_hasta:
+            return None
+        try:
+            respuesta = requests.get(TESELAS_URL.format(z=z, x=x, y=y), timeout=5,
+                                     headers={"User-Agent": "avm-bogota-informe"})
+            respuesta.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            with _lock_red:
+                _sin_red_hasta = time.time() + PAUSA_SIN_RED
+            logger.warning("Sin teselas de fondo (%s); se dibuja sobre fondo liso", e)
+            return None
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f"{ruta}.{threading.get_ident()}.tmp"
+        with open(temporal, "wb") as f:
+            f.write(respuesta.content)
+        os.replace(temporal, ruta)
+    with Image.open(ruta) as imagen:
+        return np.asarray(imagen.convert("RGBA"))
+
+
+def _mundo(lon, lat, zoom):
+    """Lon/lat a píxeles de mundo de Mapbox (teselas de 512 px) en ``zoom``."""
+    escala = 512 * 2 ** zoom
+    lon = np.asarray(lon, dtype=float)
+    lat = np.radians(np.clip(np.asarray(lat, dtype=float), -85.0511, 85.0511))
+    x = (lon + 180) / 360 * escala
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * escala
+    return x, y
+
+
+def _fondo(ax, xmin, xmax, ymin, ymax, zoom):
+    z = int(min(max(round(zoom) + 1, 0), 19))
+    lado = 512 * 2 ** zoom / 2 ** z  # tamaño de una tesela de 256 px en píxeles de mundo
+    for tx in range(int(xmin // lado), int(xmax // lado) + 1):
+        for ty in range(max(int(ymin // lado), 0), min(int(ymax // lado), 2 ** z - 1) + 1):
+            imagen = _tesela(z, tx % 2 ** z, ty) if TESELAS_ACTIVAS else None
+            if imagen is None:
+                continue
+            ax.imshow(imagen, extent=(tx * lado, (tx + 1) * lado, (ty + 1) * lado, ty * lado),
+                      interpolation="bilinear", zorder=0)
+
+
+# --- Mapas ---
+def _anillos(geometria):
+    if geometria is None:
+        return []
+    coords = geometria["coordinates"]
+    if geometria["type"] == "Polygon":
+        return [coords[0]]
+    if geometria["type"] == "MultiPolygon":
+        return [poligono[0] for poligono in coords]
+    return []
+
+
+def _escala(colorscale):
+    return LinearSegmentedColormap.from_list("plotly", [(p, color(c)) for p, c in colorscale])
+
+
+def _choropleth(ax, fig, traza, zoom):
+    clave = (traza.featureidkey or "id").split(".")
+    features = {}
+    for feature in traza.geojson["features"]:
+        valor = feature
+        for parte in clave:
+            valor = valor.get(parte, {}) if isinstance(valor, dict) else {}
+        features[str(valor)] = feature
+
+    opacidad = 1.0 if traza.marker.opacity is None else traza.marker.opacity
+    if traza.coloraxis:
+        eje = fig.layout[traza.coloraxis]
+        escala, zmin, zmax = eje.colorscale, eje.cmin, eje.cmax
+    else:
+        escala, zmin, zmax = traza.colorscale, traza.zmin, traza.zmax
+    z = np.asarray(traza.z, dtype=float)
+    normalizar = Normalize(np.nanmin(z) if zmin is None else zmin, np.nanmax(z) if zmax is None else zmax)
+    mapa_color = _escala(escala)
+
+    poligonos, colores = [], []
+    for ubicacion, valor in zip(traza.locations, z):
+        feature = features.get(str(ubicacion))
+        if feature is None:
+            continue
+        for anillo in _anillos(feature["geometry"]):
+            anillo = np.asarray(anillo)
+            poligonos.append(np.column_stack(_mundo(anillo[:, 0], anillo[:, 1], zoom)))
+            colores.append(mapa_color(normalizar(valor)))
+    if poligonos:
+        colores = np.asarray(colores)
+        colores[:, 3] *= opacidad
+        ax.add_collection(PolyCollection(poligonos, facecolors=colores, edgecolors=(1, 1, 1, 0.6),
+                                         linewidths=0.3, zorder=2))
+    if not traza.coloraxis and escala and escala[0][1] == escala[-1][1]:
+        # Color discreto de plotly express: una traza por categoría
+        ax.fill([], [], color=color(escala[0][1], opacidad), label=traza.name)
+
+
+def _scattermapbox(ax, traza, zoom, color_defecto):
+    lon = np.array([np.nan if v is None else v for v in traza.lon], dtype=float)
+    lat = np.array([np.nan if v is None else v for v in traza.lat], dtype=float)
+    x, y = _mundo(lon, lat, zoom)
+    modo = traza.mode or "markers"
+    linea = color(traza.line.color or color_defecto)
+    if traza.fill == "toself":
+        ax.fill(x, y, facecolor=color(traza.fillcolor or traza.line.color or color_defecto, 0.5 if not traza.fillcolor else 1),
+                edgecolor=linea, linewidth=traza.line.width or 2, label=traza.name, zorder=3)
+    elif "lines" in modo:
+        ax.plot(x, y, color=linea, linewidth=traza.line.width or 2, label=traza.name, zorder=3)
+    if "markers" in modo:
+        tamaño = traza.marker.size if traza.marker.size is not None else 6
+        ax.scatter(x, y, s=np.asarray(tamaño, dtype=float) ** 2, color=color(traza.marker.color or color_defecto),
+                   label=None if traza.fill == "toself" else traza.name, zorder=4)
+
+
+def _mapa(fig, ax, ancho_px, alto_px):
+    mapbox = fig.layout.mapbox
+    zoom = mapbox.zoom if mapbox.zoom is not None else 1
+    if mapbox.center is not None and mapbox.center.lon is not None:
+        cx, cy = _mundo(mapbox.center.lon, mapbox.center.lat, zoom)
+    else:
+        cx, cy = _mundo(0, 0, zoom)
+    xmin, xmax = cx - ancho_px / 2, cx + ancho_px / 2
+    ymin, ymax = cy - alto_px / 2, cy + alto_px / 2
+
+    ax.set_xlim(xmin, xmax)
+    ax.set_ylim(ymax, ymin)
+    ax.set_axis_off()
+    _fondo(ax, xmin, xmax, ymin, ymax, zoom)
+
+    colorway = _colorway(fig)
+    for i, traza in enumerate(fig.data):
+        if traza.type == "choroplethmapbox":
+            _choropleth(ax, fig, traza, zoom)
+        elif traza.type == "scattermapbox":
+            _scattermapbox(ax, traza, zoom, colorway[i % len(colorway)])
+        else:
+            logger.warning("Traza %s no soportada en mapas; se omite", traza.type)
+
+
+# --- Gráficos cartesianos ---
+def _categorias(fig, eje, trazas, campo, campo_valor):
+    categorias = []
+    for traza in trazas:
+        for c in getattr(traza, campo):
+            if c not in categorias:
+                categorias.append(c)
+    orden = fig.layout[eje].categoryorder
+    if orden in ("total ascending", "total descending"):
+        totales = {c: 0.0 for c in categorias}
+        for traza in trazas:
+            for c, v in zip(getattr(traza, campo), getattr(traza, campo_valor)):
+                totales[c] += v
+        categorias.sort(key=totales.get, reverse=orden == "total descending")
+    return categorias
+
+
+def _barras(fig, ax, trazas, colorway):
+    horizontal = trazas[0].orientation == "h"
+    campo, campo_valor = ("y", "x") if horizontal else ("x", "y")
+    categorias = _categorias(fig, "yaxis" if horizontal else "xaxis", trazas, campo, campo_valor)
+    posicion = {c: i for i, c in enumerate(categorias)}
+    apilado = fig.layout.barmode in ("stack", "relative")
+
+    # En modo agrupado cada categoría se reparte entre las trazas que la usan
+    por_categoria = {c: [t for t in range(len(trazas)) if c in list(getattr(trazas[t], campo))] for c in categorias}
+    base = np.zeros(len(categorias))
+    for i, traza in enumerate(trazas):
+        cats = list(getattr(traza, campo))
+        valores = np.asarray(getattr(traza, campo_valor), dtype=float)
+        pos = np.array([posicion[c] for c in cats], dtype=float)
+        ancho = np.full(len(cats), 0.8)
+        if not apilado:
+            n = np.array([len(por_categoria[c]) for c in cats])
+            orden = np.array([por_categoria[c].index(i) for c in cats])
+            ancho = 0.8 / n
+            pos = pos - 0.4 + ancho * (orden + 0.5)
+        inicio = base[pos.astype(int)] if apilado else 0
+        colores = _colores(traza.marker.color, len(cats), colorway[i % len(colorway)])
+        etiqueta = traza.name if traza.name and traza.showlegend is not False else None
+        if horizontal:
+            barras = ax.barh(pos, valores, height=ancho, left=inicio, color=colores, label=etiqueta)
+        else:
+            barras = ax.bar(pos, valores, width=ancho, bottom=inicio, color=colores, label=etiqueta)
+        if apilado:
+            np.add.at(base, pos.astype(int), valores)
+        if traza.text is not None:
+            textos = [traza.text] * len(cats) if isinstance(traza.text, str) else list(traza.text)
+            ax.bar_label(barras, labels=[_texto(t) for t in textos], padding=3, fontsize=9,
+                         label_type="center" if traza.textposition == "inside" else "edge")
+
+    eje_cat = ax.set_yticks if horizontal else ax.set_xticks
+    eje_cat(range(len(categorias)), [str(c) for c in categorias])
+    ax.margins(**({"x": 0.15} if horizontal else {"y": 0.12}))
+
+
+def _dispersion(ax, traza, color_defecto):
+    x, y = list(traza.x), np.asarray(traza.y, dtype=float)
+    modo = traza.mode or "markers"
+    categorico = any(isinstance(v, str) for v in x)
+    xs = np.arange(len(x)) if categorico else np.asarray(x, dtype=float)
+    c = color(traza.line.color or traza.marker.color or color_defecto) if isinstance(traza.marker.color or "", str) else color(color_defecto)
+    if "lines" in modo:
+        ax.plot(xs, y, color=c, linewidth=traza.line.width or 2, label=traza.name, zorder=2)
+    if "markers" in modo:
+        tamaño = traza.marker.size if traza.marker.size is not None else 6
+        tamaño = np.asarray(tamaño, dtype=float)
+        if traza.marker.sizeref:
+            # Tamaño por área como en plotly: diámetro = sqrt(valor / sizeref)
+            tamaño = np.sqrt(tamaño / traza.marker.sizeref)
+        ax.scatter(xs, y, s=tamaño ** 2, color=c, zorder=3, alpha=0.9,
+                   label=traza.name if "lines" not in modo else None)
+    if "text" in modo and traza.text is not None:
+        arriba = "top" in (traza.textposition or "")
+        for xi, yi, t in zip(xs, y, traza.text):
+            ax.annotate(_texto(t), (xi, yi), textcoords="offset points", xytext=(0, 8 if arriba else -12),
+                        ha="center", fontsize=9)
+    if categorico:
+        ax.set_xticks(range(len(x)), [str(v) for v in x])
+
+
+def _formato_eje(eje_mpl, eje_plotly):
+    formato = eje_plotly.tickformat
+    if formato and formato.endswith("%"):
+        decimales = int(re.sub(r"\D", "", formato) or 0)
+        eje_mpl.set_major_formatter(PercentFormatter(1.0, decimals=decimales))
+    else:
+        eje_mpl.set_major_formatter(FuncFormatter(lambda v, _: f"{v:,.0f}" if abs(v) >= 1000 else f"{v:g}"))
+
+
+def _cartesiano(fig, ax):
+    colorway = _colorway(fig)
+    barras = [t for t in fig.data if t.type == "bar"]
+    if barras:
+        _barras(fig, ax, barras, colorway)
+    for i, traza in enumerate(fig.data):
+        if traza.type == "scatter":
+            _dispersion(ax, traza, colorway[i % len(colorway)])
+        elif traza.type != "bar":
+            logger.warning("Traza %s no soportada; se omite", traza.type)
+
+    horizontal = bool(barras) and barras[0].orientation == "h"
+    ax.set_xlabel(_texto(fig.layout.xaxis.title.text))
+    ax.set_ylabel(_texto(fig.layout.yaxis.title.text))
+    if horizontal:
+        _formato_eje(ax.xaxis, fig.layout.xaxis)
+    else:
+        _formato_eje(ax.yaxis, fig.layout.yaxis)
+    # Estilo simple_white
+    ax.spines[["top", "right"]].set_visible(False)
+    if max(map(len, _textos_ticks(ax.xaxis)), default=0) > 10:
+        ax.tick_params(axis="x", labelrotation=30)
+        for etiqueta in ax.get_xticklabels():
+            etiqueta.set_ha("right")
+
+
+def _textos_ticks(eje):
+    """Textos de las marcas sin dibujar la figura (formateador sobre las posiciones)."""
+    return eje.get_major_formatter().format_ticks(eje.get_majorticklocs())
+
+
+def _margenes(figura, ax, titulo):
+    """Márgenes fijos estimados a partir de los textos.
+
+    Sustituye a ``tight_layout``, que dibuja la figura completa una vez más
+    solo para medir las etiquetas.
+    """
+    ancho, alto = figura.bbox.width, figura.bbox.height
+    arriba = (60 if "\n" in titulo else 45) if titulo else 15
+    izq, abajo = 15, 15
+    if ax.axison:
+        izq += 12 + PX_CARACTER * max(map(len, _textos_ticks(ax.yaxis)), default=0)
+        izq += 18 if ax.get_ylabel() else 0
+        rotacion = ax.xaxis.get_major_ticks()[0].label1.get_rotation() if ax.xaxis.get_major_ticks() else 0
+        largo_x = max(map(len, _textos_ticks(ax.xaxis)), default=0)
+        abajo += 20 + (PX_CARACTER * largo_x * 0.5 if rotacion else 0)
+        abajo += 18 if ax.get_xlabel() else 0
+    figura.subplots_adjust(left=min(izq / ancho, 0.45), right=1 - 15 / ancho,
+                           bottom=min(abajo / alto, 0.45), top=1 - arriba / alto)
+
+
+def _torta(fig, ax):
+    traza = fig.data[0]
+    colores = traza.marker.colors or fig.layout.piecolorway or _colorway(fig)
+    colores = [color(colores[i % len(colores)]) for i in range(len(traza.values))]
+    info = traza.textinfo or "percent"
+    ax.pie(traza.values, labels=list(traza.labels) if "label" in info else None,
+           autopct="%1.1f%%" if "percent" in info else None, colors=colores, startangle=90, counterclock=False,
+           textprops={"fontsize": traza.textfont.size or 10})
+    ax.axis("equal")
+
+
+# --- Punto de entrada ---
+def a_png(fig):
+    """Renderiza una figura Plotly a PNG (BytesIO) sin navegador."""
+    ancho = fig.layout.width or ANCHO
+    alto = fig.layout.height or ALTO
+    figura = Figure(figsize=(ancho / DPI, alto / DPI), dpi=DPI, facecolor="white")
+    FigureCanvasAgg(figura)
+
+    margen = fig.layout.margin
+    mapa = any(t.type in ("scattermapbox", "choroplethmapbox") for t in fig.data)
+    torta = any(t.type == "pie" for t in fig.data)
+    if mapa:
+        izq, der = margen.l or 0, margen.r or 0
+        arriba, abajo = margen.t if margen.t is not None else 40, margen.b or 0
+        ax = figura.add_axes([izq / ancho, abajo / alto, 1 - (izq + der) / ancho, 1 - (arriba + abajo) / alto])
+        _mapa(fig, ax, ancho - izq - der, alto - arriba - abajo)
+    else:
+        ax = figura.add_subplot()
+        if torta:
+            _torta(fig, ax)
+        else:
+            _cartesiano(fig, ax)
+
+    titulo = _texto(fig.layout.title.text)
+    if titulo:
+        figura.suptitle(titulo, x=0.02, ha="left", fontsize=11 if "\n" in titulo else 13)
+    _, etiquetas = ax.get_legend_handles_labels()
+    if fig.layout.showlegend is not False and len([e for e in etiquetas if e and not e.startswith("_")]) > (0 if mapa else 1):
+        ax.legend(loc="upper right", fontsize=8, frameon=True)
+    if not mapa:
+        _margenes(figura, ax, titulo)
+
+    buffer = BytesIO()
+    figura.savefig(buffer, format="png", dpi=DPI)
+    buffer.seek(0)
+    return buffer
+
+
+# --- Comparativa con kaleido ---
+def _figuras_informe(datos):
+    """Las figuras del informe para una manzana de los datos sintéticos."""
+    import analisis
+    import figuras
+    from proyeccion import matriz_proyeccion
+
+    localidades, manzanas = datos["localidades"], datos["manzanas"]
+    localidad_sel = localidades["nombre_localidad"].iloc[0]
+    cod = analisis.codigo_localidad(localidades, localidad_sel)
+    manzanas_sel, color_map = analisis.manzanas_de_localidad(datos["areas"], manzanas, cod)
+    manzana_id = manzanas_sel["id_manzana_unif"].iloc[len(manzanas_sel) // 2]
+    contexto = analisis.contexto_espacial(manzanas[manzanas["id_manzana_unif"] == manzana_id],
+                                          datos["transporte"], datos["colegios"])
+    comparativo = analisis.comparativo_valor(manzanas_sel, manzana_id)
+    return {
+        "localidad": figuras.figura_localidad(localidades, localidad_sel)[0],
+        "transporte": figuras.figura_transporte(contexto),
+        "colegios": figuras.figura_colegios(contexto),
+        "valorm2": figuras.figura_comparativo(comparativo),
+        "dist_pot": figuras.figura_distribucion_pot(comparativo["conteo_uso"], color_map, manzana_id),
+        "proyeccion": figuras.figura_proyeccion(matriz_proyeccion(manzanas).serie(manzana_id), manzana_id),
+        "seguridad": figuras.figura_seguridad(analisis.tabla_seguridad(localidades, cod)),
+        "manzanas": figuras.figura_manzanas(manzanas_sel, color_map),
+    }
+
+
+def comparar(datos, repeticiones=3, salida=None):
+    """Tiempo medio (ms) por figura con cada backend; ``None`` si falló."""
+    import plotly.io as pio
+
+    backends = {
+        "matplotlib": a_png,
+        "kaleido": lambda fig: pio.to_image(fig, format="png", engine="kaleido"),
+    }
+    resultados = []
+    for nombre, fig in _figuras_informe(datos).items():
+        fila = {"figura": nombre}
+        for backend, render in backends.items():
+            try:
+                render(fig)  # calentamiento (arranque de Chromium, teselas, fuentes)
+                t0 = time.perf_counter()
+                for _ in range(repeticiones):
+                    png = render(fig)
+                fila[backend] = (time.perf_counter() - t0) / repeticiones * 1000
+                if salida:
+                    os.makedirs(salida, exist_ok=True)
+                    with open(os.path.join(salida, f"{nombre}_{backend}.png"), "wb") as f:
+                        f.write(png.getvalue() if isinstance(png, BytesIO) else png)
+            except Exception as e:
+                logger.warning("%s con %s: %s", nombre, backend, e)
+                fila[backend] = None
+        resultados.append(fila)
+    return resultados
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from datos_prueba import generar_datasets, leer_geojson
+
+    parser = argparse.ArgumentParser(description="Compara el render de las figuras del informe: matplotlib frente a kaleido.")
+    parser.add_argument("--datos", help="carpeta con los GeoJSON (por defecto se generan datos sintéticos)")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--salida", help="guarda aquí los PNG de ambos backends")
+    args = parser.parse_args()
+
+    datos = leer_geojson(args.datos) if args.datos else generar_datasets()
+    print(f"{'figura':<12} {'matplotlib ms':>14} {'kaleido ms':>11}")
+    for fila in comparar(datos, args.repeticiones, args.salida):
+        celdas = [f"{fila[b]:>{w}.1f}" if fila[b] is not None else f"{'error':>{w}}"
+                  for b, w in (("matplotlib", 14), ("kaleido", 11))]
+        print(f"{fila['figura']:<12} {' '.join(celdas)}")